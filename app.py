@@ -2,7 +2,6 @@ import os
 import logging
 from flask import Flask, request, jsonify, render_template, send_from_directory
 from google.cloud import documentai_v1 as documentai
-from google.cloud import storage
 from google.cloud import logging as cloud_logging
 import google.generativeai as genai
 import uuid
@@ -11,7 +10,20 @@ from datetime import datetime, timedelta
 import sys
 import tempfile
 import shutil
-from doc_extract import process_document_with_docai
+import hashlib
+import threading
+import time
+from doc_extract import count_pages, process_document_with_docai
+from doc_store import DocumentReader, split_pages, write_document
+from summary_tree import build_summary_tree, select_context
+from page_cache import PageTextCache
+from storage_backend import ReadThroughCache, create_storage_backend
+from preprocess import DEFAULT_TARGET_DPI, SUPPORTED_MIME_TYPES, get_mime_type, preprocess_document
+from chunked_upload import UploadSessionError, UploadSessionStore
+from singleflight import SingleFlight
+from scheduler import ExtractionScheduler, SchedulerSaturated
+from search_index import SearchIndex
+from prompt_compaction import DEFAULT_MIN_PAGES, compact_pages
 
 # Configure logging
 logging.basicConfig(
@@ -66,9 +78,87 @@ try:
     
     # Create temporary directory for file processing
     TEMP_DIR = '/tmp/uploads'
+    DOCUMENT_EXTENSION = '.bpd'
+    
+    # Shared document storage; use STORAGE_BACKEND=gcs when running more than one instance
+    storage_backend = create_storage_backend(
+        os.getenv('STORAGE_BACKEND', 'local'),
+        local_root=os.getenv('STORAGE_DIR', os.path.join(TEMP_DIR, 'store')),
+        bucket_name=os.getenv('GCS_BUCKET'),
+        prefix=os.getenv('GCS_PREFIX', '')
+    )
+    document_cache = ReadThroughCache(
+        storage_backend,
+        os.path.join(TEMP_DIR, 'cache'),
+        max_bytes=int(os.getenv('DOCUMENT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+    )
+    logger.info(f"Document storage backend: {type(storage_backend).__name__}")
+    
+    # Identical uploads and questions that arrive while one is in flight wait for its result
+    upload_flights = SingleFlight("upload")
+    question_flights = SingleFlight("ask")
+    
+    # Fair, size-aware admission for Document AI work so small permits are not stuck behind large plan sets
+    extraction_scheduler = ExtractionScheduler(
+        max_concurrent=int(os.getenv('EXTRACTION_CONCURRENCY', '4')),
+        max_large_concurrent=int(os.getenv('EXTRACTION_MAX_LARGE', '1')),
+        large_job_pages=int(os.getenv('LARGE_JOB_PAGES', '100')),
+        max_queued=int(os.getenv('EXTRACTION_MAX_QUEUED', '32')),
+        queue_timeout=float(os.getenv('EXTRACTION_QUEUE_TIMEOUT', '120'))
+    )
+    
+    # Header set by a trusted authenticating proxy that identifies the caller; clients cannot set it
+    TENANT_HEADER = os.getenv('TENANT_HEADER')
+    
+    # Resumable chunked uploads share the document storage backend so any instance can take a chunk
+    upload_sessions = UploadSessionStore(
+        storage_backend,
+        max_upload_bytes=int(os.getenv('MAX_UPLOAD_BYTES', str(200 * 1024 * 1024)))
+    )
+    # Chunks of one upload may reach different instances, so the chunked protocol needs a shared
+    # backend; set CHUNKED_UPLOADS_ENABLED=true to use it with local storage on a single instance
+    CHUNKED_UPLOADS_ENABLED = os.getenv(
+        'CHUNKED_UPLOADS_ENABLED', 'true' if storage_backend.shared else 'false'
+    ).lower() == 'true'
+    logger.info(f"Chunked uploads {'enabled' if CHUNKED_UPLOADS_ENABLED else 'disabled'}")
+    
+    # Documents larger than this are answered from a summary tree instead of the full text
+    MAX_PROMPT_CHARS = int(os.getenv('MAX_PROMPT_CHARS', '400000'))
+    SUMMARY_TREE_ENABLED = os.getenv('SUMMARY_TREE_ENABLED', 'false').lower() == 'true'
+    logger.info(f"Summary tree {'enabled' if SUMMARY_TREE_ENABLED else 'disabled'} (max prompt chars: {MAX_PROMPT_CHARS})")
     os.makedirs(TEMP_DIR, exist_ok=True)
     logger.info(f"Created temporary directory at {TEMP_DIR}")
     
+    # Cache extracted page text so unchanged pages of a permit revision are not OCR'd again
+    if os.getenv('PAGE_CACHE_ENABLED', 'true').lower() == 'true':
+        page_cache = PageTextCache(
+            os.getenv('PAGE_CACHE_DIR', os.path.join(TEMP_DIR, 'page_cache')),
+            max_bytes=int(os.getenv('PAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            ttl=timedelta(hours=float(os.getenv('PAGE_CACHE_TTL_HOURS', '24')))
+        )
+        logger.info(f"Page text cache enabled at {page_cache.cache_dir}")
+    else:
+        page_cache = None
+    
+    # Shrink uploads (grayscale, OCR resolution, recompression) before sending them to Document AI
+    PREPROCESS_ENABLED = os.getenv('PREPROCESS_ENABLED', 'true').lower() == 'true'
+    PREPROCESS_DPI = int(os.getenv('PREPROCESS_DPI', str(DEFAULT_TARGET_DPI)))
+    
+    # Send headers, footers and boilerplate repeated across pages to Gemini only once
+    PROMPT_COMPACTION_ENABLED = os.getenv('PROMPT_COMPACTION_ENABLED', 'true').lower() == 'true'
+    PROMPT_COMPACTION_MIN_PAGES = int(os.getenv('PROMPT_COMPACTION_MIN_PAGES', str(DEFAULT_MIN_PAGES)))
+    
+    # Full-text index of stored documents; each instance keeps its own and syncs it from the storage backend
+    search_index = SearchIndex(max_bytes=int(os.getenv('SEARCH_INDEX_MAX_BYTES', str(128 * 1024 * 1024))))
+    # Documents the sync has already seen, by ID, with their expiry; includes documents the index had no room for
+    search_index_synced = {}
+    SEARCH_INDEX_SYNC_SECONDS = int(os.getenv('SEARCH_INDEX_SYNC_SECONDS', '300'))
+    MAX_SEARCH_PAGE_SIZE = 100
+    # Search is scoped to the tenant, which is only an authenticated identity behind TENANT_HEADER;
+    # set SEARCH_ENABLED=true to search by client address anyway, where one NAT shares a tenant
+    SEARCH_ENABLED = os.getenv('SEARCH_ENABLED', 'true' if TENANT_HEADER else 'false').lower() == 'true'
+    logger.info(f"Search {'enabled' if SEARCH_ENABLED else 'disabled'}")
+    
 except Exception as e:
     logger.error(f"Application initialization failed: {str(e)}", exc_info=True)
     raise
@@ -79,7 +169,7 @@ def favicon():
     return send_from_directory(os.path.join(app.root_path, 'static'),
                              'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
-def process_document(file_path: str) -> tuple:
+def process_document(file_path: str, mime_type: str = "application/pdf") -> tuple:
     """Process a document using Document AI."""
     try:
         logger.info(f"Starting document processing for file: {file_path}")
@@ -120,93 +210,460 @@ def process_document(file_path: str) -> tuple:
             raise ValueError(error_msg)
         
         # Process the document using doc_extract
-        document, page_count = process_document_with_docai(
+        result = process_document_with_docai(
             project_id=project_id,
             location=location,
             processor_id=processor_id,
             file_path=file_path,
-            mime_type="application/pdf"
+            mime_type=mime_type,
+            page_cache=page_cache
         )
         
-        if document is None:
+        if result is None:
             error_msg = "Document processing failed - no document returned"
             logger.error(error_msg)
             raise Exception(error_msg)
             
-        if not document.text:
+        if not result.text:
             error_msg = "Document processing failed - no text extracted"
             logger.error(error_msg)
             raise Exception(error_msg)
             
-        logger.info(f"Successfully processed document. Extracted text length: {len(document.text)}")
-        return document.text, page_count
+        logger.info(f"Successfully processed document. Extracted text length: {len(result.text)}")
+        return result.text, result.page_count, result.page_offsets, result.sections
         
     except Exception as e:
         logger.error(f"Error processing document: {str(e)}", exc_info=True)
         raise
 
-def store_document_content(text: str, filename: str) -> str:
-    """Store document content in temporary storage."""
+def get_document_key(document_id: str) -> str:
+    """Return the storage backend key of a stored document."""
+    return f"documents/{document_id}{DOCUMENT_EXTENSION}"
+
+def build_document_summary_tree(text: str, page_offsets: list, prompt_chars: int = None) -> dict:
+    """
+    Summarize a large document into a summary tree using Gemini, or return None if not needed.
+
+    prompt_chars is the length of the text questions would be sent with, when
+    it is shorter than text (for example after prompt compaction). If Gemini
+    fails, the document is stored without a tree and questions fall back to
+    the full text.
+    """
+    if not SUMMARY_TREE_ENABLED or (prompt_chars or len(text)) <= MAX_PROMPT_CHARS:
+        return None
+
+    model = genai.GenerativeModel('gemini-1.5-flash')
+
+    def summarize(prompt):
+        response = model.generate_content(prompt)
+        return response.text
+
+    try:
+        return build_summary_tree(split_pages(text, page_offsets), summarize)
+    except Exception as e:
+        logger.error(f"Could not build summary tree, storing document without one: {str(e)}", exc_info=True)
+        return None
+
+def store_document_content(
+    text: str,
+    filename: str,
+    page_offsets: list = None,
+    sections: list = None,
+    summary_tree: dict = None,
+    compact_text: str = None,
+    compaction: dict = None,
+    tenant: str = None
+) -> str:
+    """
+    Store document content in temporary storage.
+
+    compact_text, if given and shorter than text, is stored alongside the
+    pages and used for prompts; compaction holds its size stats. tenant is
+    who uploaded the document; only they can find it through search.
+    """
     try:
         # Generate a unique document ID
         document_id = str(uuid.uuid4())
         
-        # Create document data
-        document_data = {
-            "text": text,
+        # Create document metadata
+        created_at = datetime.now()
+        expires_at = created_at + timedelta(hours=24)  # Documents expire after 24 hours
+        metadata = {
+            "document_id": document_id,
             "filename": filename,
-            "created_at": datetime.now().isoformat(),
-            "expires_at": (datetime.now() + timedelta(hours=24)).isoformat()  # Documents expire after 24 hours
+            "created_at": created_at.isoformat(),
+            "expires_at": expires_at.isoformat(),
+            "tenant": tenant
         }
+        if compaction:
+            metadata["prompt_compaction"] = compaction
         
-        # Store in temporary directory
-        doc_dir = os.path.join(TEMP_DIR, f"tmp{document_id[:8]}")
-        os.makedirs(doc_dir, exist_ok=True)
-        
-        doc_path = os.path.join(doc_dir, f"{document_id}.json")
-        with open(doc_path, 'w') as f:
-            json.dump(document_data, f)
+        # Write to a temporary file, then hand it to the storage backend
+        doc_key = get_document_key(document_id)
+        fd, doc_path = tempfile.mkstemp(dir=TEMP_DIR, suffix=DOCUMENT_EXTENSION)
+        os.close(fd)
+        try:
+            # Pages are compressed individually so page ranges can be read on their own
+            pages = split_pages(text, page_offsets)
+            blobs = {}
+            if summary_tree:
+                blobs["summary_tree"] = json.dumps(summary_tree)
+            if compact_text and len(compact_text) < len(text):
+                blobs["compact_text"] = compact_text
+            stored_size = write_document(doc_path, pages, metadata, sections, blobs)
+            document_cache.store(doc_key, doc_path)
+        finally:
+            os.remove(doc_path)
             
-        logger.info(f"Stored document {document_id} in {doc_path}")
+        logger.info(f"Stored document {document_id} as {doc_key} ({len(text)} chars, {stored_size} bytes)")
+        search_index.add_document(document_id, pages, filename, expires_at, created_at, tenant)
+        search_index_synced[document_id] = expires_at
+        prune_expired_documents()
         return document_id
         
     except Exception as e:
         logger.error(f"Error storing document: {str(e)}")
         raise
 
-def get_document_content(document_id: str) -> str:
-    """Retrieve document content from temporary storage."""
+def is_valid_document_id(document_id: str) -> bool:
+    """Document IDs are canonical UUID strings; anything else must not be used to build a path or key."""
     try:
-        # Look for the document in all temporary directories
-        for temp_dir in os.listdir(TEMP_DIR):
-            if temp_dir.startswith('tmp'):
-                doc_path = os.path.join(TEMP_DIR, temp_dir, f"{document_id}.json")
-                if os.path.exists(doc_path):
-                    # Read and parse the document data
-                    with open(doc_path, 'r') as f:
-                        document_data = json.load(f)
-                    
-                    # Check if document has expired
-                    expires_at = datetime.fromisoformat(document_data['expires_at'])
-                    if datetime.now() > expires_at:
-                        logger.info(f"Document {document_id} has expired")
-                        return None
-                        
-                    logger.info(f"Retrieved document content for {document_id}")
-                    return document_data['text']
-        
-        logger.error(f"Document not found: {document_id}")
+        return str(uuid.UUID(document_id)) == document_id
+    except (ValueError, TypeError, AttributeError):
+        return False
+
+def open_document(document_id: str) -> DocumentReader:
+    """
+    Open a stored document for reading.
+
+    Returns None if the document ID is invalid, the document does not exist in
+    the current format, or it has expired. The caller must close the reader.
+    """
+    # Reject anything but a UUID before building a storage key
+    if not is_valid_document_id(document_id):
+        logger.error(f"Invalid document ID: {document_id}")
         return None
+
+    # Served from local disk when this instance has already read the document
+    doc_path = document_cache.fetch(get_document_key(document_id))
+    if doc_path is None:
+        return None
+
+    reader = DocumentReader(doc_path)
+
+    # Check if document has expired
+    expires_at = datetime.fromisoformat(reader.metadata['expires_at'])
+    if datetime.now() > expires_at:
+        logger.info(f"Document {document_id} has expired")
+        reader.close()
+        return None
+
+    return reader
+
+def get_document_content(document_id: str, start_page: int = 0, end_page: int = None) -> str:
+    """
+    Retrieve document content from temporary storage.
+
+    Only the pages in [start_page, end_page) are decompressed; by default the
+    whole document is returned.
+    """
+    # Validate once before either the current or the legacy lookup builds a path
+    if not is_valid_document_id(document_id):
+        logger.error(f"Invalid document ID: {document_id}")
+        return None
+
+    try:
+        reader = open_document(document_id)
+        if reader is None:
+            return get_legacy_document_content(document_id)
+
+        with reader:
+            text = reader.read_text(start_page, end_page)
+
+        logger.info(f"Retrieved document content for {document_id}")
+        return text
         
     except Exception as e:
         logger.error(f"Error retrieving document: {str(e)}")
         return None
 
+def get_question_context(document_id: str, question: str) -> str:
+    """
+    Retrieve the document text to put into a prompt for a question.
+
+    Documents that fit in MAX_PROMPT_CHARS are returned in full, using the
+    compacted text when one was stored. Larger documents with a summary tree
+    are answered from the summaries and the pages that best match the
+    question.
+    """
+    if not is_valid_document_id(document_id):
+        logger.error(f"Invalid document ID: {document_id}")
+        return None
+
+    try:
+        reader = open_document(document_id)
+        if reader is None:
+            return get_document_content(document_id)
+
+        with reader:
+            summary_tree = reader.read_blob("summary_tree")
+            compact_text = reader.read_blob("compact_text")
+            prompt_length = len(compact_text) if compact_text else reader.text_length
+            if prompt_length <= MAX_PROMPT_CHARS or not summary_tree:
+                return compact_text or reader.read_text()
+
+            context = select_context(json.loads(summary_tree), question, reader.read_text, MAX_PROMPT_CHARS)
+
+        logger.info(f"Selected {len(context)} chars of context from summary tree for {document_id}")
+        return context
+
+    except Exception as e:
+        logger.error(f"Error retrieving document context: {str(e)}")
+        return None
+
+def get_legacy_document_content(document_id: str) -> str:
+    """Retrieve a document stored as a plain JSON blob by earlier releases."""
+    doc_path = os.path.join(TEMP_DIR, f"tmp{document_id[:8]}", f"{document_id}.json")
+    if not os.path.exists(doc_path):
+        logger.error(f"Document not found: {document_id}")
+        return None
+
+    with open(doc_path, 'r') as f:
+        document_data = json.load(f)
+
+    expires_at = datetime.fromisoformat(document_data['expires_at'])
+    if datetime.now() > expires_at:
+        logger.info(f"Document {document_id} has expired")
+        return None
+
+    logger.info(f"Retrieved legacy document content for {document_id}")
+    return document_data['text']
+
+def prune_expired_documents():
+    """Drop expired documents from the search index and delete them from storage."""
+    for document_id in search_index.prune_expired():
+        try:
+            document_cache.delete(get_document_key(document_id))
+        except Exception as e:
+            logger.error(f"Error deleting expired document {document_id}: {str(e)}")
+
+def index_stored_document(document_id: str, key: str) -> bool:
+    """
+    Add a document from the storage backend to the search index.
+
+    The document is read straight from the backend rather than through the
+    read-through cache, so syncing does not evict documents that are being
+    asked about. Expired documents are deleted instead. Returns True if the
+    document was indexed.
+    """
+    doc_path = storage_backend.local_path(key)
+    download_path = None
+    if doc_path is None:
+        fd, download_path = tempfile.mkstemp(dir=TEMP_DIR, suffix=DOCUMENT_EXTENSION)
+        os.close(fd)
+        if not storage_backend.download_file(key, download_path):
+            os.remove(download_path)
+            return False
+        doc_path = download_path
+    try:
+        with DocumentReader(doc_path) as reader:
+            metadata = reader.metadata
+            expires_at = datetime.fromisoformat(metadata['expires_at'])
+            if datetime.now() > expires_at:
+                logger.info(f"Deleting expired document {document_id} from storage")
+                document_cache.delete(key)
+                return False
+            search_index_synced[document_id] = expires_at
+            return search_index.add_document(
+                document_id,
+                reader.read_pages(0, reader.page_count),
+                metadata['filename'],
+                expires_at,
+                datetime.fromisoformat(metadata['created_at']),
+                metadata.get('tenant')
+            )
+    finally:
+        if download_path is not None and os.path.exists(download_path):
+            os.remove(download_path)
+
+def sync_search_index():
+    """
+    Index stored documents this instance has not seen yet.
+
+    Documents uploaded through other instances only reach this instance's
+    index here. Each document is read once per instance; documents the index
+    has no room for are not read again. Expired documents found in storage
+    are deleted.
+    """
+    prune_expired_documents()
+    now = datetime.now()
+    listed = set()
+    added = 0
+    for key in storage_backend.list_keys("documents/"):
+        if not key.endswith(DOCUMENT_EXTENSION):
+            continue
+        document_id = os.path.basename(key)[:-len(DOCUMENT_EXTENSION)]
+        listed.add(document_id)
+        expires_at = search_index_synced.get(document_id)
+        if expires_at is not None:
+            # Documents evicted from a full index are not pruned by it, so delete them here once expired
+            if now > expires_at and document_id not in search_index:
+                document_cache.delete(key)
+            continue
+        try:
+            added += index_stored_document(document_id, key)
+        except Exception as e:
+            logger.error(f"Error indexing document {document_id}: {str(e)}")
+
+    for document_id in search_index_synced.copy():
+        if document_id not in listed and document_id not in search_index:
+            search_index_synced.pop(document_id, None)
+    logger.info(f"Search index sync added {added} documents ({len(search_index)} indexed, ~{search_index.size_bytes} bytes)")
+
+def run_search_index_sync():
+    """
+    Sync the search index, remove expired upload sessions and prune the page
+    cache at startup and then every SEARCH_INDEX_SYNC_SECONDS.
+    """
+    while True:
+        try:
+            sync_search_index()
+        except Exception as e:
+            logger.error(f"Search index sync failed: {str(e)}", exc_info=True)
+        try:
+            upload_sessions.prune_expired()
+        except Exception as e:
+            logger.error(f"Upload session pruning failed: {str(e)}", exc_info=True)
+        if page_cache is not None:
+            try:
+                page_cache.prune()
+            except Exception as e:
+                logger.error(f"Page cache pruning failed: {str(e)}", exc_info=True)
+        time.sleep(SEARCH_INDEX_SYNC_SECONDS)
+
+if SEARCH_INDEX_SYNC_SECONDS > 0:
+    threading.Thread(target=run_search_index_sync, name="search-index-sync", daemon=True).start()
+
 @app.route('/')
 def index():
     """Serve the main page."""
     logger.info("Serving index page")
-    return render_template('index.html')
+    return render_template('index.html', chunked_uploads=CHUNKED_UPLOADS_ENABLED)
+
+def hash_file(file_path: str) -> str:
+    """Return the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_tenant_id() -> str:
+    """
+    Identify who a request is for, for fair scheduling and search scoping.
+
+    Only values the client cannot choose are used: the header named by
+    TENANT_HEADER when a trusted authenticating proxy sets it (for example
+    IAP's X-Goog-Authenticated-User-Email), otherwise the client address that
+    Cloud Run's front end appends as the last X-Forwarded-For entry. Without
+    an authenticating proxy, tenants are client addresses, so fairness is
+    best-effort: clients behind one NAT share a tenant, and a client that
+    controls many addresses can appear as many tenants.
+    """
+    if TENANT_HEADER:
+        tenant = request.headers.get(TENANT_HEADER)
+        if tenant:
+            return tenant
+    forwarded_for = request.headers.get('X-Forwarded-For', '')
+    return forwarded_for.split(',')[-1].strip() or request.remote_addr or 'anonymous'
+
+def saturated_error(error: SchedulerSaturated):
+    """Build a 503 response telling the client when to retry."""
+    response = jsonify({"error": f"{str(error)}. Please retry in {error.retry_after} seconds.", "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+def normalize_question(question: str) -> str:
+    """Normalize a question so trivially different spellings of it coalesce."""
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+def process_uploaded_file(file_path: str, filename: str, mime_type: str, content_hash: str = None) -> dict:
+    """
+    Run a saved upload through preprocessing, extraction and storage, and return the response data.
+
+    If the same tenant is already processing the same file content, wait for
+    that result instead of sending it to Document AI again. Uploads are not
+    shared across tenants so that each tenant owns the documents it can search.
+    """
+    # Verify file was saved correctly
+    if not os.path.exists(file_path):
+        raise FileNotFoundError("Failed to save uploaded file")
+        
+    # Get file size
+    file_size = os.path.getsize(file_path)
+    if file_size == 0:
+        raise ValueError("Uploaded file is empty")
+        
+    logger.info(f"File saved successfully: {file_path} ({file_size} bytes)")
+    
+    content_hash = content_hash or hash_file(file_path)
+    tenant = get_tenant_id()
+    result, shared = upload_flights.do(
+        f"{tenant}:{content_hash}",
+        lambda: extract_and_store(file_path, filename, mime_type, tenant)
+    )
+    
+    if shared:
+        # Another request processed the same content; our copy of the file is not needed
+        os.remove(file_path)
+        logger.info(f"Reused in-flight processing of identical upload for {filename}")
+        result = dict(result, filename=filename)
+    
+    return result
+
+def extract_and_store(file_path: str, filename: str, mime_type: str, tenant: str) -> dict:
+    """Preprocess, extract and store a saved upload for tenant, and return the response data."""
+    # Shrink the file before it is sent to Document AI
+    preprocessing = None
+    if PREPROCESS_ENABLED:
+        file_path, mime_type, preprocessing = preprocess_document(file_path, mime_type, PREPROCESS_DPI)
+    
+    # Wait for a processing slot, costed by page count and size
+    estimated_pages = count_pages(file_path, mime_type) or 1
+    with extraction_scheduler.slot(tenant, estimated_pages, os.path.getsize(file_path)):
+        # Process the document
+        document_text, page_count, page_offsets, sections = process_document(file_path, mime_type)
+    
+    # Build a compact prompt text that carries repeated boilerplate once
+    compact_text, compaction = None, None
+    if PROMPT_COMPACTION_ENABLED:
+        compact_text, compaction = compact_pages(split_pages(document_text, page_offsets), PROMPT_COMPACTION_MIN_PAGES)
+    
+    # Summarize documents too large to send to Gemini in full
+    summary_tree = build_document_summary_tree(document_text, page_offsets, compaction and compaction["compact_chars"])
+    
+    # Store the document content
+    document_id = store_document_content(
+        document_text, filename, page_offsets, sections, summary_tree, compact_text, compaction, tenant
+    )
+    
+    # Clean up the temporary file since we don't need it anymore
+    os.remove(file_path)
+    logger.info(f"Cleaned up temporary file: {file_path}")
+    
+    return {
+        "success": True,
+        "message": "Document processed successfully",
+        "document_id": document_id,
+        "filename": filename,
+        "page_count": page_count,
+        "preprocessing": preprocessing,
+        "prompt_compaction": compaction
+    }
+
+def unsupported_file_type_error():
+    supported = ", ".join(ext.lstrip('.').upper() for ext in SUPPORTED_MIME_TYPES)
+    return jsonify({"error": f"Unsupported file type. Supported types: {supported}"}), 400
 
 @app.route('/upload', methods=['POST'])
 def upload():
@@ -219,8 +676,9 @@ def upload():
         if file.filename == '':
             return jsonify({"error": "No file selected"}), 400
             
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({"error": "Only PDF files are supported"}), 400
+        mime_type = get_mime_type(file.filename)
+        if mime_type is None:
+            return unsupported_file_type_error()
             
         # Create a temporary directory for this upload
         temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
@@ -229,37 +687,112 @@ def upload():
             file_path = os.path.join(temp_dir, file.filename)
             file.save(file_path)
             
-            # Verify file was saved correctly
-            if not os.path.exists(file_path):
-                raise FileNotFoundError("Failed to save uploaded file")
-                
-            # Get file size
-            file_size = os.path.getsize(file_path)
-            if file_size == 0:
-                raise ValueError("Uploaded file is empty")
-                
-            logger.info(f"File saved successfully: {file_path} ({file_size} bytes)")
+            return jsonify(process_uploaded_file(file_path, file.filename, mime_type))
             
-            # Process the document
-            document_text, page_count = process_document(file_path)
+        except Exception as e:
+            # Clean up on error
+            try:
+                shutil.rmtree(temp_dir)
+                logger.info(f"Cleaned up temporary directory after error: {temp_dir}")
+            except Exception as cleanup_error:
+                logger.error(f"Error cleaning up temporary directory: {str(cleanup_error)}")
+            raise
             
-            # Store the document content
-            document_id = store_document_content(document_text, file.filename)
+    except SchedulerSaturated as e:
+        logger.warning(f"Upload rejected, processing saturated: {str(e)}")
+        return saturated_error(e)
+    except FileNotFoundError as e:
+        logger.error(f"File error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in upload: {str(e)}")
+        return jsonify({"error": "An unexpected error occurred while processing your document"}), 500
+
+def chunked_uploads_disabled_error():
+    """Tell the client to send the file in a single POST to /upload instead."""
+    return jsonify({"error": "Chunked uploads are not available on this server; use /upload"}), 501
+
+@app.route('/uploads', methods=['POST'])
+def start_chunked_upload():
+    """Start a resumable chunked upload."""
+    if not CHUNKED_UPLOADS_ENABLED:
+        return chunked_uploads_disabled_error()
+    try:
+        data = request.get_json(silent=True)
+        if not data or 'filename' not in data or 'size' not in data:
+            return jsonify({"error": "Missing filename or size"}), 400
             
-            # Clean up the temporary PDF file since we don't need it anymore
-            os.remove(file_path)
-            logger.info(f"Cleaned up temporary PDF file: {file_path}")
+        filename = os.path.basename(str(data['filename']))
+        if get_mime_type(filename) is None:
+            return unsupported_file_type_error()
             
-            return jsonify({
-                "success": True,
-                "message": "Document processed successfully",
-                "document_id": document_id,
-                "filename": file.filename,
-                "page_count": page_count
-            })
+        manifest = upload_sessions.create(filename, data['size'], data.get('chunk_size'))
+        return jsonify(dict(manifest, received=[])), 201
+        
+    except UploadSessionError as e:
+        logger.error(f"Upload session error: {str(e)}")
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Error starting chunked upload: {str(e)}", exc_info=True)
+        return jsonify({"error": "An unexpected error occurred while starting your upload"}), 500
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """Report which chunks of an upload have been received, so the client can resume."""
+    if not CHUNKED_UPLOADS_ENABLED:
+        return chunked_uploads_disabled_error()
+    try:
+        return jsonify(upload_sessions.status(upload_id))
+    except UploadSessionError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+@app.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """Receive one chunk of a resumable upload."""
+    if not CHUNKED_UPLOADS_ENABLED:
+        return chunked_uploads_disabled_error()
+    try:
+        manifest = upload_sessions.get_manifest(upload_id)
+        
+        # Refuse oversized bodies before reading them into memory; a body without a length could be any size
+        if request.content_length is None:
+            return jsonify({"error": "Chunks must be sent with a Content-Length header"}), 411
+        if request.content_length > manifest['chunk_size']:
+            return jsonify({"error": f"Chunks must not exceed {manifest['chunk_size']} bytes"}), 413
+            
+        result = upload_sessions.put_chunk(upload_id, index, request.get_data(), request.headers.get('X-Chunk-SHA256'))
+        return jsonify(result)
+        
+    except UploadSessionError as e:
+        logger.error(f"Chunk {index} of upload {upload_id} rejected: {str(e)}")
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Error receiving chunk {index} of upload {upload_id}: {str(e)}", exc_info=True)
+        return jsonify({"error": "An unexpected error occurred while receiving the chunk"}), 500
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Assemble a chunked upload and process it like a regular upload."""
+    if not CHUNKED_UPLOADS_ENABLED:
+        return chunked_uploads_disabled_error()
+    try:
+        manifest = upload_sessions.get_manifest(upload_id)
+        filename = manifest['filename']
+        
+        temp_dir = tempfile.mkdtemp(dir=TEMP_DIR)
+        try:
+            file_path = os.path.join(temp_dir, filename)
+            assembled = upload_sessions.assemble(upload_id, file_path)
+            
+            result = process_uploaded_file(file_path, filename, get_mime_type(filename), assembled['sha256'])
+            upload_sessions.delete(upload_id, manifest)
+            return jsonify(result)
             
         except Exception as e:
-            # Clean up on error
+            # Clean up on error; the chunks are kept so completing can be retried
             try:
                 shutil.rmtree(temp_dir)
                 logger.info(f"Cleaned up temporary directory after error: {temp_dir}")
@@ -267,6 +800,12 @@ def upload():
                 logger.error(f"Error cleaning up temporary directory: {str(cleanup_error)}")
             raise
             
+    except UploadSessionError as e:
+        logger.error(f"Upload session error: {str(e)}")
+        return jsonify({"error": str(e)}), e.status_code
+    except SchedulerSaturated as e:
+        logger.warning(f"Upload {upload_id} not processed, processing saturated: {str(e)}")
+        return saturated_error(e)
     except FileNotFoundError as e:
         logger.error(f"File error: {str(e)}")
         return jsonify({"error": str(e)}), 400
@@ -274,7 +813,7 @@ def upload():
         logger.error(f"Validation error: {str(e)}")
         return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"Error in upload: {str(e)}")
+        logger.error(f"Error completing upload: {str(e)}")
         return jsonify({"error": "An unexpected error occurred while processing your document"}), 500
 
 @app.route('/ask', methods=['POST'])
@@ -292,7 +831,7 @@ def ask_question():
         logger.info(f"Processing question for document {document_id}: {question}")
         
         # Get document content
-        document_text = get_document_content(document_id)
+        document_text = get_question_context(document_id, question)
         if not document_text:
             logger.error(f"Document not found or expired: {document_id}")
             return jsonify({"error": "Document not found or has expired. Please upload the document again."}), 404
@@ -310,7 +849,12 @@ Document content:
 Please provide a clear and concise answer based only on the information in the document."""
             
             logger.info("Sending request to Gemini API")
-            response = model.generate_content(prompt)
+            response, shared = question_flights.do(
+                (document_id, normalize_question(question)),
+                lambda: model.generate_content(prompt)
+            )
+            if shared:
+                logger.info("Reused in-flight answer for identical question")
             
             if not response:
                 logger.error("No response object returned from Gemini API")
@@ -357,8 +901,8 @@ def suggest_questions():
         document_id = data['document_id']
         logger.info(f"Generating questions for document: {document_id}")
         
-        # Get document content
-        document_text = get_document_content(document_id)
+        # Get document content (an overview for documents with a summary tree)
+        document_text = get_question_context(document_id, "Give an overview of this document")
         if not document_text:
             logger.error(f"Document not found or expired: {document_id}")
             return jsonify({"error": "Document not found or has expired. Please upload the document again."}), 404
@@ -433,6 +977,44 @@ def suggest_questions():
         logger.error(f"Error in suggest_questions: {str(e)}", exc_info=True)
         return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
 
+@app.route('/search', methods=['GET'])
+def search_documents():
+    """
+    Full-text search over the caller's stored documents.
+
+    Query parameters: q (terms, "quoted phrases", filename:term), page and
+    page_size. Only documents uploaded by the caller's tenant (see
+    get_tenant_id) are searched. Each result carries a snippet from the first
+    matching page, served from the index without reading storage.
+    """
+    if not SEARCH_ENABLED:
+        return jsonify({"error": "Search is not available on this server"}), 501
+    started = time.perf_counter()
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing search query"}), 400
+
+    try:
+        page = int(request.args.get('page', '1'))
+        page_size = int(request.args.get('page_size', '10'))
+    except ValueError:
+        return jsonify({"error": "page and page_size must be integers"}), 400
+    if page < 1 or not 1 <= page_size <= MAX_SEARCH_PAGE_SIZE:
+        return jsonify({"error": f"page must be at least 1 and page_size between 1 and {MAX_SEARCH_PAGE_SIZE}"}), 400
+
+    prune_expired_documents()
+    found = search_index.search(query, page, page_size, tenant=get_tenant_id())
+
+    logger.info(f"Search '{query}' matched {found['total']} documents")
+    return jsonify({
+        "query": query,
+        "total": found["total"],
+        "page": page,
+        "page_size": page_size,
+        "results": found["results"],
+        "took_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
 @app.route('/view-logs')
 def view_logs():
     """View logged questions from Google Cloud Logging."""
@@ -0,0 +1,195 @@
+import math
+import json
+import uuid
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+
+
+class UploadSessionError(ValueError):
+    """Raised when a chunked upload request is invalid. Carries the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadSessionStore:
+    """
+    Resumable chunked uploads kept in a storage backend.
+
+    A session is created with the file name and size, receives numbered chunks
+    in any order (each optionally verified against a SHA-256 checksum), and is
+    assembled into a single file once every chunk has arrived. Sessions and
+    chunks live in the shared storage backend, so chunks of one upload may be
+    received by different instances.
+    """
+
+    def __init__(self, backend, max_upload_bytes: int, session_ttl: timedelta = timedelta(hours=24)):
+        self.backend = backend
+        self.max_upload_bytes = max_upload_bytes
+        self.session_ttl = session_ttl
+
+    @staticmethod
+    def _manifest_key(upload_id: str) -> str:
+        return f"uploads/{upload_id}/manifest.json"
+
+    @staticmethod
+    def _chunk_key(upload_id: str, index: int) -> str:
+        return f"uploads/{upload_id}/chunks/{index:06d}"
+
+    def create(self, filename: str, size: int, chunk_size: int = None) -> dict:
+        """Starts an upload session and returns its manifest."""
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadSessionError("File size must be a positive integer")
+        if size > self.max_upload_bytes:
+            raise UploadSessionError(f"File is too large; the limit is {self.max_upload_bytes} bytes", 413)
+        if chunk_size is not None and (not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or chunk_size <= 0):
+            raise UploadSessionError("Chunk size must be a positive integer")
+
+        chunk_size = min(max(chunk_size or DEFAULT_CHUNK_SIZE, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+        manifest = {
+            "upload_id": str(uuid.uuid4()),
+            "filename": filename,
+            "size": size,
+            "chunk_size": chunk_size,
+            "total_chunks": math.ceil(size / chunk_size),
+            "created_at": datetime.now().isoformat(),
+            "expires_at": (datetime.now() + self.session_ttl).isoformat(),
+        }
+        self.backend.put(self._manifest_key(manifest["upload_id"]), json.dumps(manifest).encode("utf-8"))
+        logger.info(f"Started upload {manifest['upload_id']} for {filename} ({size} bytes, {manifest['total_chunks']} chunks)")
+        return manifest
+
+    def get_manifest(self, upload_id: str) -> dict:
+        """Returns the manifest of an upload session, raising UploadSessionError if it is unknown or expired."""
+        try:
+            uuid.UUID(upload_id)
+        except (ValueError, TypeError, AttributeError):
+            raise UploadSessionError("Invalid upload ID")
+
+        data = self.backend.get(self._manifest_key(upload_id))
+        if data is None:
+            raise UploadSessionError("Upload not found", 404)
+
+        manifest = json.loads(data.decode("utf-8"))
+        if datetime.now() > datetime.fromisoformat(manifest["expires_at"]):
+            raise UploadSessionError("Upload has expired. Please start the upload again.", 404)
+        return manifest
+
+    def expected_chunk_size(self, manifest: dict, index: int) -> int:
+        """Returns the exact size chunk `index` must have."""
+        if index < manifest["total_chunks"] - 1:
+            return manifest["chunk_size"]
+        return manifest["size"] - manifest["chunk_size"] * (manifest["total_chunks"] - 1)
+
+    def put_chunk(self, upload_id: str, index: int, data: bytes, checksum: str = None) -> dict:
+        """
+        Stores one chunk of an upload.
+
+        Args:
+            upload_id: The upload session ID
+            index: 0-based chunk number
+            data: Chunk bytes
+            checksum: Optional hex SHA-256 of data; the chunk is rejected if it does not match
+        """
+        manifest = self.get_manifest(upload_id)
+        if not 0 <= index < manifest["total_chunks"]:
+            raise UploadSessionError(f"Chunk index must be between 0 and {manifest['total_chunks'] - 1}")
+
+        expected_size = self.expected_chunk_size(manifest, index)
+        if len(data) != expected_size:
+            raise UploadSessionError(f"Chunk {index} must be {expected_size} bytes, got {len(data)}")
+
+        digest = hashlib.sha256(data).hexdigest()
+        if checksum and checksum.lower() != digest:
+            raise UploadSessionError(f"Checksum mismatch for chunk {index}", 422)
+
+        self.backend.put(self._chunk_key(upload_id, index), data)
+        return {"upload_id": upload_id, "index": index, "sha256": digest}
+
+    def received_chunks(self, upload_id: str, manifest: dict = None) -> list:
+        """Returns the indexes of the chunks received so far."""
+        manifest = manifest or self.get_manifest(upload_id)
+        return [i for i in range(manifest["total_chunks"]) if self.backend.exists(self._chunk_key(upload_id, i))]
+
+    def status(self, upload_id: str) -> dict:
+        """Returns the manifest plus the list of received chunks, used by clients to resume."""
+        manifest = self.get_manifest(upload_id)
+        return dict(manifest, received=self.received_chunks(upload_id, manifest))
+
+    def assemble(self, upload_id: str, output_path: str) -> dict:
+        """
+        Joins all chunks into output_path.
+
+        The session is kept so that completing can be retried if processing
+        the assembled file fails; call delete once it has been processed.
+
+        Returns:
+            The session manifest, with the SHA-256 of the whole file added
+        """
+        manifest = self.get_manifest(upload_id)
+        received = set(self.received_chunks(upload_id, manifest))
+        missing = [i for i in range(manifest["total_chunks"]) if i not in received]
+        if missing:
+            raise UploadSessionError(f"Upload is missing {len(missing)} chunk(s): {missing[:20]}", 409)
+
+        digest = hashlib.sha256()
+        with open(output_path, "wb") as output_file:
+            for index in range(manifest["total_chunks"]):
+                data = self.backend.get(self._chunk_key(upload_id, index))
+                if data is None:
+                    raise UploadSessionError(f"Chunk {index} disappeared before the upload was completed", 409)
+                digest.update(data)
+                output_file.write(data)
+
+        logger.info(f"Assembled upload {upload_id} into {output_path}")
+        return dict(manifest, sha256=digest.hexdigest())
+
+    def delete(self, upload_id: str, manifest: dict = None):
+        """Removes an upload session and its chunks."""
+        manifest = manifest or self.get_manifest(upload_id)
+        for index in range(manifest["total_chunks"]):
+            self.backend.delete(self._chunk_key(upload_id, index))
+        self.backend.delete(self._manifest_key(upload_id))
+
+    def prune_expired(self, now: datetime = None) -> list:
+        """
+        Removes expired and abandoned upload sessions from the backend.
+
+        Chunks whose manifest is missing are removed too; a manifest is always
+        written before any chunk of its session.
+
+        Returns:
+            The IDs of the removed sessions
+        """
+        now = now or datetime.now()
+        sessions = {}
+        for key in self.backend.list_keys("uploads/"):
+            sessions.setdefault(key.split("/")[1], []).append(key)
+
+        removed = []
+        for upload_id, keys in sessions.items():
+            data = self.backend.get(self._manifest_key(upload_id))
+            if data is not None:
+                try:
+                    if now <= datetime.fromisoformat(json.loads(data.decode("utf-8"))["expires_at"]):
+                        continue
+                except (ValueError, KeyError):
+                    logger.warning(f"Removing upload {upload_id} with an unreadable manifest")
+            # Delete chunks before the manifest so an interrupted sweep is picked up next time
+            for key in sorted(keys, key=lambda k: k.endswith("manifest.json")):
+                self.backend.delete(key)
+            removed.append(upload_id)
+
+        if removed:
+            logger.info(f"Removed {len(removed)} expired or abandoned uploads")
+        return removed
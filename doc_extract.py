@@ -1,13 +1,31 @@
 import os
+from dataclasses import dataclass, field
 from google.cloud import documentai_v1 as documentai
+from google.protobuf import field_mask_pb2
 import logging
+from PIL import Image
 from PyPDF2 import PdfReader, PdfWriter
 import math
+from doc_store import split_pages
+from page_cache import fingerprint_pages
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# The only parts of the Document AI response we read: the text and each page's layout, whose text
+# anchor says where the page starts in it. Blocks, paragraphs, lines, tokens and the rest of the
+# page are left out of the response. The field mask only accepts top-level and pages.{field} paths.
+RESPONSE_FIELDS = ["text", "pages.layout"]
+
+@dataclass
+class ExtractionResult:
+    """Text extracted from a document, without the Document AI layout data."""
+    text: str
+    page_count: int
+    page_offsets: list[int] = field(default_factory=list)
+    sections: list[dict] = field(default_factory=list)
+
 def split_pdf(input_path: str, max_size_mb: int = 15) -> list[str]:
     """
     Splits a PDF file into smaller chunks if it exceeds the maximum size.
@@ -69,38 +87,172 @@ def split_pdf(input_path: str, max_size_mb: int = 15) -> list[str]:
         logger.error(f"Error splitting PDF: {str(e)}", exc_info=True)
         return [input_path]  # Return original file if splitting fails
 
+def get_page_offsets(document) -> list[int]:
+    """
+    Returns the character offset at which each page starts in document.text,
+    based on the text anchors Document AI attaches to every page layout.
+    """
+    offsets = []
+    previous_end = 0
+    for page in document.pages:
+        segments = page.layout.text_anchor.text_segments
+        if segments:
+            offsets.append(min(int(segment.start_index) for segment in segments))
+            previous_end = max(int(segment.end_index) for segment in segments)
+        else:
+            # Pages without text start where the previous page ended
+            offsets.append(previous_end)
+    return offsets
+
+def write_pages(input_path: str, page_numbers: list[int]) -> str:
+    """
+    Writes the given pages (0-based) of a PDF into a new PDF next to the input.
+
+    Returns:
+        Path to the new PDF file
+    """
+    reader = PdfReader(input_path)
+    writer = PdfWriter()
+    for page_num in page_numbers:
+        writer.add_page(reader.pages[page_num])
+
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    output_path = os.path.join(os.path.dirname(input_path), f"{base_name}_uncached.pdf")
+    with open(output_path, "wb") as output_file:
+        writer.write(output_file)
+
+    logger.info(f"Wrote {len(page_numbers)} uncached pages to {output_path}")
+    return output_path
+
+def count_pages(file_path: str, mime_type: str) -> int:
+    """Returns the number of pages in a PDF or frames in an image (multi-page TIFF), or None for unreadable files."""
+    try:
+        if mime_type == "application/pdf":
+            return len(PdfReader(file_path).pages)
+        with Image.open(file_path) as image:
+            return getattr(image, "n_frames", 1)
+    except Exception as e:
+        logger.warning(f"Could not count pages of {file_path}: {str(e)}")
+        return None
+
+def process_chunk(client, resource_name: str, file_path: str, mime_type: str) -> list[str]:
+    """
+    Sends a single file to Document AI.
+
+    Returns:
+        The text of each page, or None if processing failed or no text was extracted
+    """
+    # Read the file into memory
+    with open(file_path, "rb") as image:
+        image_content = image.read()
+    logger.info(f"Read file: {file_path} ({len(image_content)} bytes)")
+
+    # Create the raw document object
+    raw_document = documentai.RawDocument(
+        content=image_content, mime_type=mime_type
+    )
+
+    # Configure the process request with imageless mode for better page limit handling
+    request = documentai.ProcessRequest(
+        name=resource_name,
+        raw_document=raw_document,
+        field_mask=field_mask_pb2.FieldMask(paths=RESPONSE_FIELDS),
+        process_options=documentai.ProcessOptions(
+            ocr_config=documentai.OcrConfig(
+                enable_native_pdf_parsing=True,
+                enable_image_quality_scores=False,
+                enable_symbol=False
+            )
+        )
+    )
+
+    # Process the document
+    logger.info(f"Processing document: {file_path} with processor: {resource_name}...")
+    try:
+        result = client.process_document(request=request)
+        document = result.document
+        logger.info("Document processing complete.")
+
+        if not document:
+            logger.error("No document returned from Document AI")
+            return None
+
+        if not document.text:
+            logger.warning("Document processed but no text was extracted")
+            return None
+
+        logger.info(f"Extracted {len(document.text)} chars from {len(document.pages)} pages")
+        
+        return split_pages(document.text, get_page_offsets(document))
+        
+    except Exception as e:
+        logger.error(f"Error during document processing: {str(e)}", exc_info=True)
+        if hasattr(e, 'details'):
+            logger.error(f"Error details: {e.details}")
+        return None
+
 def process_document_with_docai(
     project_id: str,
     location: str,
     processor_id: str,
     file_path: str,
     mime_type: str,
+    page_cache=None,
 ):
     """
     Processes a document using a Google Cloud Document AI standard extractor.
     If the file is too large, it will be split into smaller chunks and processed separately.
 
+    When a page cache is given, PDF pages are fingerprinted first and only pages
+    whose text is not cached (for example the pages changed in a permit
+    revision) are sent to Document AI. Cached and new pages are merged back in
+    page order.
+
     Args:
         project_id: Your Google Cloud project ID.
         location: The region of your Document AI processor (e.g., "us").
         processor_id: The ID of your Document AI processor.
         file_path: The local path to the document file (e.g., "my_document.pdf").
         mime_type: The MIME type of the document (e.g., "application/pdf", "image/png").
+        page_cache: Optional PageTextCache used to reuse text of previously seen pages.
 
     Returns:
-        A tuple containing:
-        - A Document object containing the extracted information, or None if an error occurs
-        - The number of pages in the document
+        An ExtractionResult with the combined text, the number of pages, the
+        character offset at which each page starts and the sections of the
+        text (runs of pages taken from the cache or from the same processed
+        chunk), or None if an error occurs
     """
+    ocr_file = file_path
     try:
+        # Look up previously extracted pages by fingerprint
+        page_texts = None
+        cache_keys = []
+        uncached = None
+        fingerprints = None
+        if page_cache is not None and mime_type == "application/pdf":
+            try:
+                fingerprints = fingerprint_pages(file_path)
+            except Exception as e:
+                # Encrypted or damaged PDFs that PyPDF2 cannot read may still be readable by Document AI
+                logger.warning(f"Could not fingerprint pages, skipping page cache: {str(e)}")
+        if fingerprints is not None:
+            cache_keys = [f"{processor_id}:{fingerprint}" for fingerprint in fingerprints]
+            page_texts = [page_cache.get(key) for key in cache_keys]
+            uncached = [i for i, text in enumerate(page_texts) if text is None]
+            logger.info(f"Page cache: {len(page_texts) - len(uncached)} hits, {len(uncached)} misses")
+
+            # Only send the pages we have not seen before
+            if uncached and len(uncached) < len(page_texts):
+                ocr_file = write_pages(file_path, uncached)
+
         # Split the PDF if it's too large
-        file_paths = split_pdf(file_path)
+        file_paths = split_pdf(ocr_file) if uncached is None or uncached else []
         logger.info(f"Processing {len(file_paths)} file(s)")
-        
-        all_text = []
-        total_pages = 0
-        
-        for current_file in file_paths:
+
+        ocr_texts = []
+        ocr_sources = []
+        ocr_cacheable = []
+        if file_paths:
             # Set up client options for the specific region
             client_options = {"api_endpoint": f"{location}-documentai.googleapis.com"}
             client = documentai.DocumentProcessorServiceClient(client_options=client_options)
@@ -109,81 +261,64 @@ def process_document_with_docai(
             resource_name = client.processor_path(project_id, location, processor_id)
             logger.info(f"Using processor: {resource_name}")
 
-            # Read the file into memory
-            with open(current_file, "rb") as image:
-                image_content = image.read()
-            logger.info(f"Read file: {current_file} ({len(image_content)} bytes)")
+        for current_file in file_paths:
+            expected_pages = count_pages(current_file, mime_type)
+            texts = process_chunk(client, resource_name, current_file, mime_type)
 
-            # Create the raw document object
-            raw_document = documentai.RawDocument(
-                content=image_content, mime_type=mime_type
-            )
+            # Texts are matched to fingerprints by position, so only cache chunks whose page count checks out
+            cacheable = True
+            if texts is not None and expected_pages is not None and len(texts) != expected_pages:
+                logger.warning(f"Expected {expected_pages} pages from {current_file}, got {len(texts)}; not caching them")
+                texts = (texts + [""] * expected_pages)[:expected_pages]
+                cacheable = False
+            if texts is None:
+                # Keep failed pages as gaps so cached pages stay aligned
+                texts = [None] * (expected_pages or 0)
 
-            # Configure the process request with imageless mode for better page limit handling
-            request = documentai.ProcessRequest(
-                name=resource_name,
-                raw_document=raw_document,
-                process_options=documentai.ProcessOptions(
-                    ocr_config=documentai.OcrConfig(
-                        enable_native_pdf_parsing=True,
-                        enable_image_quality_scores=False,
-                        enable_symbol=False
-                    )
-                )
-            )
+            ocr_texts.extend(texts)
+            ocr_sources.extend([os.path.basename(current_file)] * len(texts))
+            ocr_cacheable.extend([cacheable] * len(texts))
 
-            # Process the document
-            logger.info(f"Processing document: {current_file} with processor: {processor_id}...")
-            try:
-                result = client.process_document(request=request)
-                document = result.document
-                logger.info("Document processing complete.")
-
-                if not document:
-                    logger.error("No document returned from Document AI")
-                    continue
-
-                if not document.text:
-                    logger.warning("Document processed but no text was extracted")
-                    continue
-
-                # Get the number of pages and log progress
-                page_count = len(document.pages) if hasattr(document, 'pages') else 0
-                logger.info(f"Document has {page_count} pages")
-                
-                # Log progress for each page
-                for i, page in enumerate(document.pages, 1):
-                    logger.info(f"Processed page {i}/{page_count}")
-                
-                logger.info(f"Extracted text length: {len(document.text)}")
-                
-                all_text.append(document.text)
-                total_pages += page_count
-                
-            except Exception as e:
-                logger.error(f"Error during document processing: {str(e)}", exc_info=True)
-                if hasattr(e, 'details'):
-                    logger.error(f"Error details: {e.details}")
-                continue
+        # Merge newly extracted pages with the cached ones
+        if page_texts is None:
+            page_texts = ocr_texts
+            sources = ocr_sources
+        else:
+            sources = ["page cache"] * len(page_texts)
+            for page_num, text, source, cacheable in zip(uncached, ocr_texts, ocr_sources, ocr_cacheable):
+                if text is not None and cacheable:
+                    page_cache.put(cache_keys[page_num], text)
+                page_texts[page_num] = text
+                sources[page_num] = source
 
-        if not all_text:
+        # Drop pages that could not be processed
+        pages = [(text, source) for text, source in zip(page_texts, sources) if text is not None]
+        if not any(text for text, _ in pages):
             logger.error("No text was extracted from any of the files")
-            return None, 0
-            
-        # Combine all text
-        combined_text = "\n\n".join(all_text)
-        
-        # Create a new document with combined text
-        combined_document = documentai.Document(
-            text=combined_text,
-            mime_type=mime_type
-        )
-        
-        return combined_document, total_pages
+            return None
+
+        # Combine all text, recording where each page starts and where the source changes
+        page_offsets = []
+        sections = []
+        text_length = 0
+        for page_num, (text, source) in enumerate(pages):
+            page_offsets.append(text_length)
+            text_length += len(text)
+            if sections and sections[-1]["title"] == source:
+                sections[-1]["end_page"] = page_num + 1
+            else:
+                sections.append({"title": source, "start_page": page_num, "end_page": page_num + 1})
+        combined_text = "".join(text for text, _ in pages)
+
+        return ExtractionResult(combined_text, len(pages), page_offsets, sections)
 
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}", exc_info=True)
-        return None, 0
+        return None
+
+    finally:
+        if ocr_file != file_path and os.path.exists(ocr_file):
+            os.remove(ocr_file)
 
 if __name__ == "__main__":
     # Configuration
@@ -199,7 +334,7 @@ if __name__ == "__main__":
         exit(1)
 
     # Run the document processing
-    processed_doc, page_count = process_document_with_docai(
+    result = process_document_with_docai(
         project_id=YOUR_PROJECT_ID,
         location=YOUR_PROCESSOR_LOCATION,
         processor_id=YOUR_PROCESSOR_ID,
@@ -207,10 +342,10 @@ if __name__ == "__main__":
         mime_type=YOUR_MIME_TYPE,
     )
 
-    if processed_doc:
+    if result:
         logger.info("Successfully processed document!")
         print("\nFull Document Text for LLM processing:")
-        print(processed_doc.text)
-        print(f"Number of pages: {page_count}")
+        print(result.text)
+        print(f"Number of pages: {result.page_count}")
     else:
         logger.error("Document processing failed")
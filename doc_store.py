@@ -0,0 +1,194 @@
+import os
+import json
+import mmap
+import struct
+import zlib
+import logging
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# On-disk layout of a stored document:
+#
+#   MAGIC (4 bytes) | version (uint16) | header length (uint32) | header JSON | data
+#
+# The header holds the document metadata plus an offset table pointing into the
+# data region. Every page is zlib-compressed on its own so a page range can be
+# sliced out of a memory-mapped file without decoding the rest of the document.
+MAGIC = b"BPDS"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct(">4sHI")
+COMPRESSION_LEVEL = 6
+
+
+def split_pages(text: str, page_offsets: list = None) -> list:
+    """
+    Splits extracted text into pages using the start offset of each page.
+
+    Args:
+        text: The full extracted text
+        page_offsets: Character offset at which each page starts. If empty,
+            the whole text is treated as a single page.
+
+    Returns:
+        List of page strings
+    """
+    if not page_offsets:
+        return [text]
+
+    # Empty pages share their start offset with the next page; keep them as
+    # empty strings so page numbers stay aligned. Any text before the first
+    # page belongs to the first page.
+    offsets = sorted(page_offsets)
+    offsets[0] = 0
+    bounds = offsets + [len(text)]
+    return [text[bounds[i]:bounds[i + 1]] for i in range(len(offsets))]
+
+
+def write_document(path: str, pages: list, metadata: dict, sections: list = None, blobs: dict = None) -> int:
+    """
+    Writes a document to disk in the compressed store format.
+
+    Args:
+        path: Destination file path
+        pages: List of page texts, in order
+        metadata: JSON-serializable metadata (filename, created_at, expires_at, ...)
+        sections: Optional list of {"title", "start_page", "end_page"} entries
+        blobs: Optional named text blobs stored alongside the pages
+            (e.g. a JSON-encoded summary tree)
+
+    Returns:
+        The number of bytes written
+    """
+    data = bytearray()
+    page_table = []
+    raw_size = 0
+    for page_text in pages:
+        raw = page_text.encode("utf-8")
+        compressed = zlib.compress(raw, COMPRESSION_LEVEL)
+        page_table.append([len(data), len(compressed), len(page_text)])
+        data.extend(compressed)
+        raw_size += len(raw)
+
+    blob_table = {}
+    for name, blob_text in (blobs or {}).items():
+        compressed = zlib.compress(blob_text.encode("utf-8"), COMPRESSION_LEVEL)
+        blob_table[name] = [len(data), len(compressed)]
+        data.extend(compressed)
+
+    header = {
+        "metadata": metadata,
+        "pages": page_table,
+        "sections": sections or [{"title": "Document", "start_page": 0, "end_page": len(pages)}],
+        "blobs": blob_table,
+        "raw_size": raw_size,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    # Write to a temporary file first so readers never see a partial document
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    size = _PREAMBLE.size + len(header_bytes) + len(data)
+    logger.info(f"Wrote {len(pages)} pages to {path} ({raw_size} bytes raw, {size} bytes stored)")
+    return size
+
+
+def read_header(path: str) -> dict:
+    """Reads only the header of a stored document, without touching page data."""
+    with open(path, "rb") as f:
+        magic, version, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        _check_preamble(path, magic, version)
+        return json.loads(f.read(header_len).decode("utf-8"))
+
+
+def _check_preamble(path: str, magic: bytes, version: int):
+    if magic != MAGIC:
+        raise ValueError(f"Not a stored document: {path}")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported document format version {version}: {path}")
+
+
+class DocumentReader:
+    """
+    Memory-mapped reader for documents written by write_document.
+
+    Use as a context manager:
+
+        with DocumentReader(path) as reader:
+            first_pages = reader.read_pages(0, 5)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, header_len = _PREAMBLE.unpack_from(self._mmap, 0)
+            _check_preamble(path, magic, version)
+            header_start = _PREAMBLE.size
+            self.header = json.loads(self._mmap[header_start:header_start + header_len].decode("utf-8"))
+            self._data_start = header_start + header_len
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def metadata(self) -> dict:
+        return self.header["metadata"]
+
+    @property
+    def page_count(self) -> int:
+        return len(self.header["pages"])
+
+    @property
+    def sections(self) -> list:
+        return self.header["sections"]
+
+    def read_page(self, page_number: int) -> str:
+        """Decompresses a single page (0-based)."""
+        offset, length, _ = self.header["pages"][page_number]
+        start = self._data_start + offset
+        return zlib.decompress(self._mmap[start:start + length]).decode("utf-8")
+
+    def read_pages(self, start: int = 0, end: int = None) -> list:
+        """Decompresses the pages in [start, end) and returns them as a list."""
+        end = self.page_count if end is None else min(end, self.page_count)
+        return [self.read_page(i) for i in range(max(start, 0), end)]
+
+    def read_text(self, start: int = 0, end: int = None) -> str:
+        """Returns the text of the pages in [start, end) joined together."""
+        return "".join(self.read_pages(start, end))
+
+    @property
+    def text_length(self) -> int:
+        """Length of the full document text in characters, read from the header."""
+        return sum(entry[2] for entry in self.header["pages"])
+
+    def read_blob(self, name: str) -> str:
+        """Decompresses a named blob, or returns None if the document has none."""
+        entry = self.header.get("blobs", {}).get(name)
+        if entry is None:
+            return None
+        offset, length = entry
+        start = self._data_start + offset
+        return zlib.decompress(self._mmap[start:start + length]).decode("utf-8")
+
+    def close(self):
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,162 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Page entries that determine what Document AI sees when it renders a page; /Annots covers
+# reviewer markups and stamps, whose appearance streams are followed like any other reference
+FINGERPRINT_KEYS = ["/Contents", "/Resources", "/MediaBox", "/CropBox", "/Rotate", "/Annots"]
+
+
+def _hash_object(obj, digest, seen: set):
+    """Feeds a PDF object into a hash, following references and hashing stream data."""
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key in seen:
+            # Already hashed on this page; object numbers differ between revisions, so only mark the reuse
+            digest.update(b"<ref>")
+            return
+        seen.add(key)
+        obj = obj.get_object()
+
+    if isinstance(obj, StreamObject):
+        digest.update(b"<stream>")
+        _hash_object(DictionaryObject({k: v for k, v in obj.items() if k != "/Length"}), digest, seen)
+        digest.update(obj._data or b"")
+    elif isinstance(obj, DictionaryObject):
+        digest.update(b"<<")
+        for key in sorted(obj.keys()):
+            if key == "/Parent":
+                continue
+            digest.update(str(key).encode("utf-8"))
+            _hash_object(obj[key], digest, seen)
+        digest.update(b">>")
+    elif isinstance(obj, (ArrayObject, list)):
+        digest.update(b"[")
+        for item in obj:
+            _hash_object(item, digest, seen)
+        digest.update(b"]")
+    else:
+        digest.update(repr(obj).encode("utf-8"))
+
+
+def fingerprint_page(page) -> str:
+    """Returns a hash of a PDF page's content streams, resources and geometry."""
+    digest = hashlib.sha256()
+    seen = set()
+    for key in FINGERPRINT_KEYS:
+        digest.update(key.encode("utf-8"))
+        if key in page:
+            _hash_object(page.raw_get(key), digest, seen)
+    return digest.hexdigest()
+
+
+def fingerprint_pages(file_path: str) -> list:
+    """
+    Fingerprints every page of a PDF file.
+
+    Pages that render identically in two revisions of a permit packet get the
+    same fingerprint even though their object numbers differ.
+
+    Returns:
+        One hex digest per page, in page order
+    """
+    reader = PdfReader(file_path)
+    fingerprints = [fingerprint_page(page) for page in reader.pages]
+    logger.info(f"Fingerprinted {len(fingerprints)} pages of {file_path}")
+    return fingerprints
+
+
+class PageTextCache:
+    """
+    Persistent cache of extracted page text, keyed by page fingerprint.
+
+    Entries are plain text files under cache_dir, sharded by the first two
+    characters of the key hash. Page text is permit content, so it is kept no
+    longer than ttl after it was extracted, like the stored documents; the
+    oldest entries are also evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 64 * 1024 * 1024, ttl: timedelta = timedelta(hours=24)):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = 0
+        self.prune()
+
+    def _path(self, key: str) -> str:
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name[:2], f"{name}.txt")
+
+    def get(self, key: str) -> str:
+        """Returns the cached page text, or None on a miss or an expired entry."""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl.total_seconds():
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, text: str):
+        """Stores page text under key."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += os.path.getsize(path)
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.prune()
+
+    def prune(self) -> int:
+        """Removes expired entries, then the oldest ones until the cache fits in max_bytes. Returns the remaining size."""
+        with self._lock:
+            cutoff = time.time() - self.ttl.total_seconds()
+            entries = []
+            total = 0
+            removed = 0
+            for directory, _, filenames in os.walk(self.cache_dir):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    try:
+                        stat = os.stat(path)
+                        if stat.st_mtime < cutoff:
+                            os.remove(path)
+                            removed += 1
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    if not filename.endswith(".tmp"):
+                        entries.append((stat.st_mtime, stat.st_size, path))
+                        total += stat.st_size
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            self._size = total
+        if removed:
+            logger.info(f"Removed {removed} expired or evicted page cache entries ({total} bytes left)")
+        return total
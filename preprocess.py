@@ -0,0 +1,240 @@
+import io
+import os
+import logging
+from PIL import Image, ImageOps, ImageSequence
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import NameObject, NumberObject
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# File types accepted by Document AI, by extension
+SUPPORTED_MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+    ".webp": "image/webp",
+}
+
+# Resolution that is plenty for OCR of permit text
+DEFAULT_TARGET_DPI = 300
+
+# Phone photos carry no useful DPI; assume the page is at most 11x17 inches
+MAX_PAGE_INCHES = 17
+
+JPEG_QUALITY = 85
+
+
+def get_mime_type(filename: str) -> str:
+    """Returns the MIME type for a supported file name, or None if the type is not supported."""
+    return SUPPORTED_MIME_TYPES.get(os.path.splitext(filename)[1].lower())
+
+
+def _scale_for_ocr(image: Image.Image, target_dpi: int, dpi: float = None) -> Image.Image:
+    """Converts an image to grayscale and downscales it to about target_dpi."""
+    if image.mode not in ("1", "L"):
+        image = image.convert("L")
+
+    if dpi and dpi > target_dpi:
+        scale = target_dpi / dpi
+    else:
+        max_edge = target_dpi * MAX_PAGE_INCHES
+        scale = min(1.0, max_edge / max(image.size))
+
+    if scale < 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS if image.mode == "L" else Image.NEAREST)
+    return image
+
+
+def preprocess_image(file_path: str, mime_type: str, target_dpi: int) -> tuple:
+    """
+    Rewrites an image file as a grayscale image at OCR resolution.
+
+    Multi-page images (TIFF, GIF) are written as a single multi-page TIFF.
+
+    Returns:
+        A tuple of (output path, output MIME type)
+    """
+    base_path = os.path.splitext(file_path)[0]
+    with Image.open(file_path) as source:
+        dpi = source.info.get("dpi", (None, None))[0]
+        frames = [
+            _scale_for_ocr(ImageOps.exif_transpose(frame.copy()), target_dpi, dpi)
+            for frame in ImageSequence.Iterator(source)
+        ]
+
+    if len(frames) > 1 or mime_type == "image/tiff":
+        output_path = f"{base_path}_preprocessed.tiff"
+        compression = "group4" if all(frame.mode == "1" for frame in frames) else "tiff_deflate"
+        frames[0].save(output_path, save_all=True, append_images=frames[1:], compression=compression)
+        return output_path, "image/tiff"
+
+    if mime_type in ("image/jpeg", "image/webp"):
+        # Photos compress far better as JPEG than as lossless images
+        output_path = f"{base_path}_preprocessed.jpg"
+        frames[0].convert("L").save(output_path, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        return output_path, "image/jpeg"
+
+    output_path = f"{base_path}_preprocessed.png"
+    frames[0].save(output_path, "PNG", optimize=True)
+    return output_path, "image/png"
+
+
+def _recompress_pdf_image(image_obj, page_width_inches: float, page_height_inches: float, target_dpi: int) -> bool:
+    """
+    Downscales and recompresses an embedded image in place as a grayscale JPEG.
+
+    Only plain 8-bit JPEG and Flate images are touched; masked images and other
+    encodings are left as they are. Returns True if the image was rewritten.
+    """
+    filters = image_obj.get("/Filter")
+    if isinstance(filters, list):
+        filters = filters[0] if len(filters) == 1 else None
+    if filters not in ("/DCTDecode", "/FlateDecode"):
+        return False
+    if any(key in image_obj for key in ("/SMask", "/Mask", "/ImageMask", "/Decode")):
+        return False
+    if image_obj.get("/BitsPerComponent") != 8:
+        return False
+
+    width, height = int(image_obj["/Width"]), int(image_obj["/Height"])
+    if filters == "/DCTDecode":
+        image = Image.open(io.BytesIO(image_obj._data))
+        image.load()
+    else:
+        mode = {"/DeviceRGB": "RGB", "/DeviceGray": "L"}.get(image_obj.get("/ColorSpace"))
+        if mode is None:
+            return False
+        image = Image.frombytes(mode, (width, height), image_obj.get_data())
+
+    # Assume the image covers the page; smaller images really have a higher DPI, so this never over-shrinks
+    dpi = max(width / page_width_inches, height / page_height_inches)
+    image = _scale_for_ocr(image, target_dpi, dpi).convert("L")
+
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    data = output.getvalue()
+    if len(data) >= len(image_obj._data):
+        return False
+
+    image_obj._data = data
+    image_obj.decoded_self = None
+    image_obj[NameObject("/Filter")] = NameObject("/DCTDecode")
+    image_obj[NameObject("/ColorSpace")] = NameObject("/DeviceGray")
+    image_obj[NameObject("/Width")] = NumberObject(image.width)
+    image_obj[NameObject("/Height")] = NumberObject(image.height)
+    image_obj[NameObject("/BitsPerComponent")] = NumberObject(8)
+    image_obj.pop("/DecodeParms", None)
+    return True
+
+
+def _recompress_resources(resources, page_width_inches: float, page_height_inches: float, target_dpi: int, seen: set) -> int:
+    """Recompresses the images referenced by a resource dictionary, including those inside form XObjects."""
+    xobjects = resources.get("/XObject") if resources else None
+    if not xobjects:
+        return 0
+
+    count = 0
+    for ref in xobjects.get_object().values():
+        key = (ref.idnum, ref.generation) if hasattr(ref, "idnum") else id(ref)
+        if key in seen:
+            continue
+        seen.add(key)
+
+        xobject = ref.get_object()
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            try:
+                count += _recompress_pdf_image(xobject, page_width_inches, page_height_inches, target_dpi)
+            except Exception as e:
+                logger.warning(f"Could not recompress embedded image: {str(e)}")
+        elif subtype == "/Form":
+            count += _recompress_resources(xobject.get("/Resources"), page_width_inches, page_height_inches, target_dpi, seen)
+    return count
+
+
+def preprocess_pdf(file_path: str, target_dpi: int) -> str:
+    """
+    Rewrites a PDF with only what OCR needs.
+
+    Copying the page tree into a new file drops objects the pages do not use
+    (attachments, outlines, scripts, unreferenced leftovers of earlier edits);
+    thumbnails and page-piece data are stripped, content streams are
+    compressed and embedded images are converted to grayscale JPEG at about
+    target_dpi.
+
+    Returns:
+        Path to the rewritten PDF
+    """
+    reader = PdfReader(file_path)
+    writer = PdfWriter()
+    seen = set()
+    images = 0
+    for source_page in reader.pages:
+        page = writer.add_page(source_page)
+        for key in ("/Thumb", "/PieceInfo"):
+            page.pop(key, None)
+        page.compress_content_streams()
+
+        page_width_inches = max(float(page.mediabox.width) / 72, 1.0)
+        page_height_inches = max(float(page.mediabox.height) / 72, 1.0)
+        images += _recompress_resources(page.get("/Resources"), page_width_inches, page_height_inches, target_dpi, seen)
+
+    output_path = f"{os.path.splitext(file_path)[0]}_preprocessed.pdf"
+    with open(output_path, "wb") as output_file:
+        writer.write(output_file)
+
+    logger.info(f"Rewrote {len(reader.pages)} pages and {images} embedded images into {output_path}")
+    return output_path
+
+
+def preprocess_document(file_path: str, mime_type: str, target_dpi: int = DEFAULT_TARGET_DPI) -> tuple:
+    """
+    Shrinks a document before it is sent to Document AI.
+
+    The smaller result replaces the original file; if preprocessing fails or
+    does not save anything, the original is kept.
+
+    Args:
+        file_path: Path to the uploaded document
+        mime_type: MIME type of the uploaded document
+        target_dpi: Resolution to downscale images to
+
+    Returns:
+        A tuple containing:
+        - The path of the file to send to Document AI
+        - Its MIME type
+        - A dict with original_bytes, processed_bytes and bytes_saved
+    """
+    original_bytes = os.path.getsize(file_path)
+    output_path, output_mime_type = file_path, mime_type
+    try:
+        if mime_type == "application/pdf":
+            output_path = preprocess_pdf(file_path, target_dpi)
+        else:
+            output_path, output_mime_type = preprocess_image(file_path, mime_type, target_dpi)
+    except Exception as e:
+        logger.warning(f"Preprocessing failed, sending original file: {str(e)}", exc_info=True)
+
+    processed_bytes = os.path.getsize(output_path)
+    if output_path != file_path and processed_bytes >= original_bytes:
+        logger.info(f"Preprocessing did not reduce size ({processed_bytes} >= {original_bytes} bytes), keeping original")
+        os.remove(output_path)
+        output_path, output_mime_type, processed_bytes = file_path, mime_type, original_bytes
+    elif output_path != file_path:
+        os.remove(file_path)
+
+    stats = {
+        "original_bytes": original_bytes,
+        "processed_bytes": processed_bytes,
+        "bytes_saved": original_bytes - processed_bytes,
+    }
+    logger.info(f"Preprocessing saved {stats['bytes_saved']} of {original_bytes} bytes")
+    return output_path, output_mime_type, stats
@@ -0,0 +1,117 @@
+import math
+import hashlib
+import logging
+from collections import Counter
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A line is boilerplate if it appears on at least this many pages
+DEFAULT_MIN_PAGES = 3
+
+# Shorter lines (labels, "N/A", single numbers) cost less than a reference and are always kept
+DEFAULT_MIN_CHARS = 20
+
+# Rough size of a Gemini token in characters, used for reporting only
+CHARS_PER_TOKEN = 4
+
+LEGEND_HEADER = "Text repeated on many pages is shown once here; [R<n>] marks each place it appears:\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of prompt tokens in text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _line_key(line: str, min_chars: int) -> bytes:
+    """Hashes a line with case and whitespace normalized, or returns None for lines too short to compact."""
+    normalized = " ".join(line.split()).lower()
+    if len(normalized) < min_chars:
+        return None
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+
+
+def find_repeated_lines(pages: list, min_pages: int = DEFAULT_MIN_PAGES, min_chars: int = DEFAULT_MIN_CHARS) -> set:
+    """Returns the keys of the lines that appear on at least min_pages pages."""
+    page_counts = Counter()
+    for page in pages:
+        page_counts.update({key for key in (_line_key(line, min_chars) for line in page.splitlines()) if key})
+    return {key for key, count in page_counts.items() if count >= min_pages}
+
+
+def _format_reference(ids: list) -> str:
+    """Formats a run of reference numbers, collapsing consecutive numbers: [R1-R3,R7]."""
+    parts = []
+    start = previous = ids[0]
+    for number in ids[1:] + [None]:
+        if number is not None and number == previous + 1:
+            previous = number
+            continue
+        parts.append(f"R{start}" if start == previous else f"R{start}-R{previous}")
+        if number is not None:
+            start = previous = number
+    return f"[{','.join(parts)}]\n"
+
+
+def compact_pages(pages: list, min_pages: int = DEFAULT_MIN_PAGES, min_chars: int = DEFAULT_MIN_CHARS) -> tuple:
+    """
+    Builds a compact prompt text for a document by sending repeated lines once.
+
+    Headers, footers, code citations and legal boilerplate that appear on at
+    least min_pages pages are listed once in a legend at the top. In the page
+    text, each run of such lines is replaced by a short reference to the
+    legend entries.
+
+    Args:
+        pages: List of page texts
+        min_pages: Number of pages a line must appear on to be treated as boilerplate
+        min_chars: Minimum normalized length of a line to be treated as boilerplate
+
+    Returns:
+        A tuple containing:
+        - The compact text, or the original text if compaction saves nothing
+        - A dict with original_chars, compact_chars, original_tokens,
+          compact_tokens and repeated_lines
+    """
+    original_text = "".join(pages)
+    repeated = find_repeated_lines(pages, min_pages, min_chars)
+
+    reference_ids = {}
+    legend = []
+    body = []
+    for page in pages:
+        run = []
+        for line in page.splitlines(keepends=True):
+            key = _line_key(line, min_chars)
+            if key in repeated:
+                if key not in reference_ids:
+                    reference_ids[key] = len(legend) + 1
+                    legend.append(f"[R{reference_ids[key]}] {line.strip()}\n")
+                if not run or run[-1] != reference_ids[key]:
+                    run.append(reference_ids[key])
+                continue
+            if run:
+                body.append(_format_reference(run))
+                run = []
+            body.append(line)
+        if run:
+            body.append(_format_reference(run))
+
+    compact_text = LEGEND_HEADER + "".join(legend) + "\n" + "".join(body) if legend else original_text
+    if len(compact_text) >= len(original_text):
+        compact_text = original_text
+        legend = []
+
+    stats = {
+        "original_chars": len(original_text),
+        "compact_chars": len(compact_text),
+        "original_tokens": estimate_tokens(original_text),
+        "compact_tokens": estimate_tokens(compact_text),
+        "repeated_lines": len(legend),
+    }
+    logger.info(
+        f"Compacted prompt text from {stats['original_chars']} to {stats['compact_chars']} chars "
+        f"(~{stats['original_tokens']} to ~{stats['compact_tokens']} tokens, {stats['repeated_lines']} repeated lines)"
+    )
+    return compact_text, stats
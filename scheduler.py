@@ -0,0 +1,178 @@
+import math
+import time
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BYTES_PER_COST_UNIT = 1024 * 1024
+
+
+class SchedulerSaturated(Exception):
+    """Raised when extraction work cannot be admitted. retry_after is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    def __init__(self, seq: int, tenant: str, cost: float, large: bool):
+        self.seq = seq
+        self.tenant = tenant
+        self.cost = cost
+        self.large = large
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class ExtractionScheduler:
+    """
+    Admission control and fair scheduling for document extraction.
+
+    Each job is costed from its page count and size. At most max_concurrent
+    jobs run at once, and at most max_large_concurrent of them may be large.
+    Waiting jobs are dispatched small-first; among jobs of the same class, the
+    tenant that has received the least work so far goes next (start-time fair
+    queueing), so one tenant's burst cannot starve the others. Large jobs that
+    have waited longer than large_job_aging seconds compete with small ones so
+    they are not starved either.
+
+    When the queue is full, or a job waits longer than queue_timeout, the job
+    is rejected with SchedulerSaturated carrying a retry-after estimate.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 4,
+        max_large_concurrent: int = 1,
+        large_job_pages: int = 100,
+        large_job_bytes: int = 20 * 1024 * 1024,
+        max_queued: int = 32,
+        max_queued_per_tenant: int = 8,
+        queue_timeout: float = 120,
+        large_job_aging: float = 60,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_large_concurrent = max_large_concurrent
+        self.large_job_pages = large_job_pages
+        self.large_job_bytes = large_job_bytes
+        self.max_queued = max_queued
+        self.max_queued_per_tenant = max_queued_per_tenant
+        self.queue_timeout = queue_timeout
+        self.large_job_aging = large_job_aging
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting = []
+        self._running = 0
+        self._running_large = 0
+        self._tenant_vtime = {}
+        self._virtual_clock = 0.0
+        # Moving average of seconds of processing per cost unit, used for retry-after hints
+        self._seconds_per_cost = 1.0
+
+    def estimate_cost(self, page_count: int, size_bytes: int) -> float:
+        """Estimates the cost of a job from its page count and size in bytes."""
+        return max(page_count or 1, 1) + size_bytes / BYTES_PER_COST_UNIT
+
+    def is_large(self, page_count: int, size_bytes: int) -> bool:
+        return (page_count or 0) >= self.large_job_pages or size_bytes >= self.large_job_bytes
+
+    def _retry_after(self, extra_cost: float = 0) -> int:
+        queued_cost = sum(ticket.cost for ticket in self._waiting) + extra_cost
+        seconds = queued_cost * self._seconds_per_cost / max(self.max_concurrent, 1)
+        return min(max(int(math.ceil(seconds)), 1), 300)
+
+    def _priority(self, ticket: _Ticket, now: float) -> tuple:
+        aged = ticket.large and now - ticket.enqueued_at >= self.large_job_aging
+        job_class = 1 if ticket.large and not aged else 0
+        return (job_class, self._tenant_vtime.get(ticket.tenant, 0.0), ticket.seq)
+
+    def _dispatch(self):
+        """Grants waiting jobs while there is capacity. Must be called with the lock held."""
+        now = time.monotonic()
+        dispatched = False
+        while self._running < self.max_concurrent:
+            eligible = [
+                ticket for ticket in self._waiting
+                if not ticket.large or self._running_large < self.max_large_concurrent
+            ]
+            if not eligible:
+                break
+            ticket = min(eligible, key=lambda t: self._priority(t, now))
+            self._waiting.remove(ticket)
+
+            # A tenant that was idle starts at the current virtual time instead of its stale value
+            start = max(self._tenant_vtime.get(ticket.tenant, 0.0), self._virtual_clock)
+            self._virtual_clock = start
+            self._tenant_vtime[ticket.tenant] = start + ticket.cost
+
+            ticket.granted = True
+            self._running += 1
+            self._running_large += ticket.large
+            dispatched = True
+        if dispatched:
+            self._cond.notify_all()
+
+        # Tenants at or behind the virtual clock would restart from it anyway
+        if len(self._tenant_vtime) > 1024:
+            self._tenant_vtime = {t: v for t, v in self._tenant_vtime.items() if v > self._virtual_clock}
+
+    @contextmanager
+    def slot(self, tenant: str, page_count: int, size_bytes: int):
+        """
+        Waits for a turn to run an extraction job.
+
+        Use as a context manager around the extraction work:
+
+            with scheduler.slot(tenant, page_count, size_bytes):
+                process_document(...)
+
+        Raises:
+            SchedulerSaturated: if the queue is full or the wait times out
+        """
+        cost = self.estimate_cost(page_count, size_bytes)
+        large = self.is_large(page_count, size_bytes)
+
+        with self._cond:
+            if len(self._waiting) >= self.max_queued:
+                raise SchedulerSaturated("Document processing is at capacity", self._retry_after(cost))
+            if sum(1 for t in self._waiting if t.tenant == tenant) >= self.max_queued_per_tenant:
+                raise SchedulerSaturated("Too many documents queued for processing", self._retry_after(cost))
+
+            ticket = _Ticket(next(self._seq), tenant, cost, large)
+            self._waiting.append(ticket)
+            self._dispatch()
+
+            if not ticket.granted:
+                logger.info(f"Queued {'large' if large else 'small'} job for {tenant} (cost {cost:.1f}, {len(self._waiting)} waiting)")
+                self._cond.wait_for(lambda: ticket.granted, timeout=self.queue_timeout)
+                if not ticket.granted:
+                    self._waiting.remove(ticket)
+                    raise SchedulerSaturated("Timed out waiting for document processing", self._retry_after())
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._running -= 1
+                self._running_large -= large
+                self._seconds_per_cost = 0.8 * self._seconds_per_cost + 0.2 * (elapsed / cost)
+                self._dispatch()
+
+    def stats(self) -> dict:
+        """Returns the current queue and concurrency figures."""
+        with self._cond:
+            return {
+                "running": self._running,
+                "running_large": self._running_large,
+                "waiting": len(self._waiting),
+                "waiting_large": sum(1 for t in self._waiting if t.large),
+            }
@@ -0,0 +1,342 @@
+import re
+import math
+import zlib
+import heapq
+import bisect
+import logging
+import threading
+from array import array
+from datetime import datetime
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FIELDS = ("text", "filename")
+DEFAULT_FIELD = "text"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Rough per-entry overhead of a postings dict entry, used to estimate index memory
+POSTING_OVERHEAD_BYTES = 100
+
+# Words joined by - . or / (permit numbers, parcels, code sections) are indexed
+# whole and as their parts, all at the same position.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[\-./][a-z0-9]+)*")
+QUERY_PATTERN = re.compile(r'(?:(\w+):)?(?:"([^"]*)"|(\S+))')
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits text into (position, term) pairs.
+
+    Compound tokens such as "2022-4227" yield the whole token and each part at
+    the same position, so both "2022-4227" and "4227" match.
+    """
+    tokens = []
+    for position, match in enumerate(TOKEN_PATTERN.finditer(text.lower())):
+        token = match.group(0)
+        tokens.append((position, token))
+        parts = re.split(r"[\-./]", token)
+        if len(parts) > 1:
+            tokens.extend((position, part) for part in parts if part)
+    return tokens
+
+
+def parse_query(query: str) -> list:
+    """
+    Parses a search query into clauses.
+
+    Supported syntax: bare terms, "quoted phrases", and field:term or
+    field:"phrase" for the fields in FIELDS. Any other word before a colon
+    is searched as text, so "APN:052-123" and "10:30" match literally. All
+    clauses must match.
+
+    Returns:
+        A list of (field, [terms]) clauses; a clause with several terms is a phrase
+    """
+    clauses = []
+    for match in QUERY_PATTERN.finditer(query):
+        field, phrase, word = match.groups()
+        field = (field or DEFAULT_FIELD).lower()
+        if field in FIELDS:
+            text = phrase if phrase is not None else word
+        else:
+            field, text = DEFAULT_FIELD, match.group(0)
+        # Search whole tokens only; the parts of a compound token share its position
+        terms = []
+        last_position = None
+        for position, term in tokenize(text):
+            if position != last_position:
+                terms.append(term)
+                last_position = position
+        if terms:
+            clauses.append((field, terms))
+    return clauses
+
+
+class SearchIndex:
+    """
+    Incremental in-memory inverted index over stored documents.
+
+    Postings map (field, term) to {document_id: array of positions}, which
+    supports BM25 ranking and phrase queries. Each document's page text is
+    kept compressed so result snippets never need to read the document from
+    storage. Documents are added when they are stored and pruned when they
+    expire; once the estimated size passes max_bytes, the documents closest
+    to expiry are dropped from the index (but not from storage).
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._documents = {}
+        self._field_lengths = {field: 0 for field in FIELDS}
+        self._expiry_heap = []
+        self._bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        """Estimated memory used by the indexed documents."""
+        return self._bytes
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documents)
+
+    def __contains__(self, document_id):
+        with self._lock:
+            return document_id in self._documents
+
+    def add_document(
+        self,
+        document_id: str,
+        pages: list,
+        filename: str,
+        expires_at: datetime,
+        created_at: datetime = None,
+        tenant: str = None,
+    ) -> bool:
+        """
+        Indexes a document's text and filename. Re-adding a document replaces it.
+
+        Args:
+            document_id: The document ID
+            pages: List of page texts, used to report which page a match is on and for snippets
+            filename: The uploaded file name
+            expires_at: When the document should be dropped from the index
+            created_at: When the document was stored
+            tenant: Who uploaded the document; searches by a tenant only see its documents
+
+        Returns:
+            False if the index is full and the document expires before everything in it
+        """
+        field_postings = {field: {} for field in FIELDS}
+        page_starts = []
+        position_base = 0
+        for page_text in pages:
+            page_starts.append(position_base)
+            tokens = tokenize(page_text)
+            for position, term in tokens:
+                field_postings["text"].setdefault(term, []).append(position_base + position)
+            position_base += (tokens[-1][0] + 1) if tokens else 0
+        for position, term in tokenize(filename or ""):
+            field_postings["filename"].setdefault(term, []).append(position)
+
+        lengths = {
+            "text": position_base,
+            "filename": len(TOKEN_PATTERN.findall((filename or "").lower())),
+        }
+        compressed_pages = [zlib.compress(page_text.encode("utf-8")) for page_text in pages]
+        size = sum(len(page) for page in compressed_pages)
+        for postings in field_postings.values():
+            for term, positions in postings.items():
+                postings[term] = array("I", positions)
+                size += postings[term].itemsize * len(positions) + len(term) + POSTING_OVERHEAD_BYTES
+
+        with self._lock:
+            self.remove_document(document_id)
+            for field, postings in field_postings.items():
+                for term, positions in postings.items():
+                    self._postings.setdefault((field, term), {})[document_id] = positions
+                self._field_lengths[field] += lengths[field]
+            self._documents[document_id] = {
+                "filename": filename,
+                "created_at": created_at,
+                "expires_at": expires_at,
+                "tenant": tenant,
+                "lengths": lengths,
+                "keys": [(field, term) for field, postings in field_postings.items() for term in postings],
+                "page_starts": page_starts,
+                "pages": compressed_pages,
+                "bytes": size,
+            }
+            self._bytes += size
+            heapq.heappush(self._expiry_heap, (expires_at, document_id))
+            evicted = self._evict_to_fit()
+
+        if document_id in evicted:
+            logger.info(f"Search index is full; not indexing document {document_id}")
+            return False
+        logger.info(f"Indexed document {document_id} ({lengths['text']} tokens, {len(pages)} pages, ~{size} bytes)")
+        return True
+
+    def _evict_to_fit(self) -> list:
+        """Drops the documents closest to expiry until the index fits in max_bytes. Must be called with the lock held."""
+        evicted = []
+        while self.max_bytes is not None and self._bytes > self.max_bytes and self._expiry_heap:
+            expires_at, document_id = heapq.heappop(self._expiry_heap)
+            document = self._documents.get(document_id)
+            if document is not None and document["expires_at"] == expires_at:
+                self.remove_document(document_id)
+                evicted.append(document_id)
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} documents to keep the search index under {self.max_bytes} bytes")
+        return evicted
+
+    def remove_document(self, document_id: str) -> bool:
+        """Removes a document from the index. Returns False if it was not indexed."""
+        with self._lock:
+            document = self._documents.pop(document_id, None)
+            if document is None:
+                return False
+            for key in document["keys"]:
+                postings = self._postings.get(key)
+                if postings is not None:
+                    postings.pop(document_id, None)
+                    if not postings:
+                        del self._postings[key]
+            for field, length in document["lengths"].items():
+                self._field_lengths[field] -= length
+            self._bytes -= document["bytes"]
+            return True
+
+    def prune_expired(self, now: datetime = None) -> list:
+        """Removes every document whose expiry time has passed and returns their IDs."""
+        now = now or datetime.now()
+        removed = []
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, document_id = heapq.heappop(self._expiry_heap)
+                document = self._documents.get(document_id)
+                # Skip stale heap entries left by re-added documents
+                if document is not None and document["expires_at"] == expires_at:
+                    self.remove_document(document_id)
+                    removed.append(document_id)
+        if removed:
+            logger.info(f"Pruned {len(removed)} expired documents from the search index")
+        return removed
+
+    def _bm25(self, field: str, term_frequency: int, document_id: str, document_frequency: int) -> float:
+        total = len(self._documents)
+        idf = math.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = self._field_lengths[field] / total if total else 0
+        length = self._documents[document_id]["lengths"][field]
+        norm = 1 - B + B * (length / average_length if average_length else 0)
+        return idf * term_frequency * (K1 + 1) / (term_frequency + K1 * norm)
+
+    def _match_clause(self, field: str, terms: list) -> dict:
+        """Returns {document_id: [start positions]} for documents matching a term or phrase."""
+        postings = [self._postings.get((field, term), {}) for term in terms]
+        if len(terms) == 1:
+            return postings[0]
+
+        # Phrase: intersect on documents, then check consecutive positions
+        candidates = set(min(postings, key=len))
+        for other in postings:
+            candidates &= other.keys()
+        matches = {}
+        for document_id in candidates:
+            starts = set(postings[0][document_id])
+            for offset, other in enumerate(postings[1:], 1):
+                starts &= {position - offset for position in other[document_id]}
+                if not starts:
+                    break
+            if starts:
+                matches[document_id] = sorted(starts)
+        return matches
+
+    def search(self, query: str, page: int = 1, page_size: int = 10, tenant: str = None) -> dict:
+        """
+        Runs a query and returns one page of ranked results.
+
+        Args:
+            query: The search query, see parse_query
+            page: 1-based page of results
+            page_size: Number of results per page
+            tenant: If given, only documents uploaded by this tenant are searched
+
+        Returns:
+            A dict with "total" and "results"; each result has document_id,
+            filename, created_at, score, page (0-based page of the first match
+            in the text, or None for filename-only matches) and snippet
+        """
+        clauses = parse_query(query)
+        if not clauses:
+            return {"total": 0, "results": []}
+
+        with self._lock:
+            # Evaluate the most selective clause first
+            clause_matches = sorted(
+                ((self._match_clause(field, terms), field, terms) for field, terms in clauses),
+                key=lambda item: len(item[0])
+            )
+            candidates = set(clause_matches[0][0])
+            if tenant is not None:
+                candidates = {d for d in candidates if self._documents[d]["tenant"] == tenant}
+            for matches, _, _ in clause_matches[1:]:
+                candidates &= matches.keys()
+                if not candidates:
+                    break
+
+            scored = []
+            for document_id in candidates:
+                score = sum(
+                    self._bm25(field, len(matches[document_id]), document_id, len(matches))
+                    for matches, field, _ in clause_matches
+                )
+                scored.append((score, document_id))
+
+            total = len(scored)
+            start = (page - 1) * page_size
+            top = heapq.nlargest(start + page_size, scored)[start:]
+
+            results = []
+            for score, document_id in top:
+                document = self._documents[document_id]
+                text_positions = [
+                    matches[document_id][0] for matches, field, _ in clause_matches if field == "text"
+                ]
+                match_page = None
+                snippet = None
+                if text_positions:
+                    match_page = bisect.bisect_right(document["page_starts"], min(text_positions)) - 1
+                    snippet = make_snippet(zlib.decompress(document["pages"][match_page]).decode("utf-8"), query)
+                results.append({
+                    "document_id": document_id,
+                    "filename": document["filename"],
+                    "created_at": document["created_at"].isoformat() if document["created_at"] else None,
+                    "score": round(score, 4),
+                    "page": match_page,
+                    "snippet": snippet,
+                })
+
+        return {"total": total, "results": results}
+
+
+def make_snippet(text: str, query: str, width: int = 160) -> str:
+    """Returns a short excerpt of text around the first occurrence of a query term."""
+    lowered = text.lower()
+    positions = [
+        lowered.find(" ".join(terms))
+        for _, terms in parse_query(query)
+    ]
+    positions = [position for position in positions if position >= 0]
+    center = min(positions) if positions else 0
+    start = max(center - width // 2, 0)
+    end = min(start + width, len(text))
+    snippet = " ".join(text[start:end].split())
+    return ("..." if start > 0 else "") + snippet + ("..." if end < len(text) else "")
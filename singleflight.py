@@ -0,0 +1,72 @@
+import logging
+import threading
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is running wait for the leader and receive its result, or
+    its exception, instead of repeating the work. Nothing is cached: once the
+    leader finishes, the next call for the key runs the function again.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn) -> tuple:
+        """
+        Runs fn() unless a call with the same key is already in flight.
+
+        Returns:
+            A tuple of (result, shared), where shared is True if the result came
+            from another caller's in-flight call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+
+        if not leader:
+            logger.info(f"{self.name}: waiting on in-flight call for {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.info(f"{self.name}: shared result for {key} with {call.waiters} waiting caller(s)")
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        """Returns the number of keys currently being worked on."""
+        with self._lock:
+            return len(self._calls)
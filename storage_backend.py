@@ -0,0 +1,289 @@
+import os
+import uuid
+import shutil
+import logging
+import threading
+from abc import ABC, abstractmethod
+from google.cloud import storage
+from google.api_core.exceptions import NotFound
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class StorageBackend(ABC):
+    """
+    Interface for the object store that holds documents shared by all instances.
+
+    Keys are slash-separated paths such as "documents/<document_id>.bpd".
+    shared is True when every instance of the service sees the same objects.
+    """
+
+    shared = False
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        """Stores data under key, replacing any existing object."""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """Returns the stored bytes, or None if the key does not exist."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Removes key; deleting a missing key is not an error."""
+
+    def exists(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    @abstractmethod
+    def list_keys(self, prefix: str) -> list:
+        """Returns the keys that start with prefix."""
+
+    def upload_file(self, key: str, file_path: str):
+        with open(file_path, "rb") as f:
+            self.put(key, f.read())
+
+    def download_file(self, key: str, file_path: str) -> bool:
+        """Downloads key to file_path. Returns False if the key does not exist."""
+        data = self.get(key)
+        if data is None:
+            return False
+        with open(file_path, "wb") as f:
+            f.write(data)
+        return True
+
+    def local_path(self, key: str) -> str:
+        """Returns a local file path for key if the backend keeps objects on local disk."""
+        return None
+
+
+class LocalStorageBackend(StorageBackend):
+    """Stores objects as files under a local directory. Only shared by processes on the same machine."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> bytes:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def list_keys(self, prefix: str) -> list:
+        keys = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                key = os.path.relpath(os.path.join(directory, filename), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        return keys
+
+    def upload_file(self, key: str, file_path: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def local_path(self, key: str) -> str:
+        return self._path(key)
+
+
+class GCSStorageBackend(StorageBackend):
+    """Stores objects in a Google Cloud Storage bucket, shared by every instance."""
+
+    shared = True
+
+    def __init__(self, bucket_name: str, prefix: str = ""):
+        self.bucket = storage.Client().bucket(bucket_name)
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        logger.info(f"Using Cloud Storage bucket gs://{bucket_name}/{self.prefix}")
+
+    def _blob(self, key: str):
+        return self.bucket.blob(f"{self.prefix}{key}")
+
+    def put(self, key: str, data: bytes):
+        self._blob(key).upload_from_string(data)
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self._blob(key).download_as_bytes()
+        except NotFound:
+            return None
+
+    def delete(self, key: str):
+        try:
+            self._blob(key).delete()
+        except NotFound:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return self._blob(key).exists()
+
+    def list_keys(self, prefix: str) -> list:
+        return [blob.name[len(self.prefix):] for blob in self.bucket.list_blobs(prefix=f"{self.prefix}{prefix}")]
+
+    def upload_file(self, key: str, file_path: str):
+        self._blob(key).upload_from_filename(file_path)
+
+    def download_file(self, key: str, file_path: str) -> bool:
+        try:
+            self._blob(key).download_to_filename(file_path)
+            return True
+        except NotFound:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return False
+
+
+class InMemoryStorageBackend(StorageBackend):
+    """Keeps objects in a dict. Used in tests in place of a real object store."""
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self.objects[key] = bytes(data)
+
+    def get(self, key: str) -> bytes:
+        with self._lock:
+            return self.objects.get(key)
+
+    def delete(self, key: str):
+        with self._lock:
+            self.objects.pop(key, None)
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            return key in self.objects
+
+    def list_keys(self, prefix: str) -> list:
+        with self._lock:
+            return [key for key in self.objects if key.startswith(prefix)]
+
+
+def create_storage_backend(backend_type: str, local_root: str, bucket_name: str = None, prefix: str = "") -> StorageBackend:
+    """
+    Creates the configured storage backend.
+
+    Args:
+        backend_type: "local", "gcs" or "memory"
+        local_root: Directory used by the local backend
+        bucket_name: Bucket used by the gcs backend
+        prefix: Object name prefix used by the gcs backend
+    """
+    backend_type = backend_type.lower()
+    if backend_type == "local":
+        return LocalStorageBackend(local_root)
+    if backend_type == "gcs":
+        if not bucket_name:
+            raise ValueError("GCS_BUCKET must be set when STORAGE_BACKEND is gcs")
+        return GCSStorageBackend(bucket_name, prefix)
+    if backend_type == "memory":
+        return InMemoryStorageBackend()
+    raise ValueError(f"Unknown storage backend: {backend_type}")
+
+
+class ReadThroughCache:
+    """
+    Local, in-instance cache of objects from a storage backend.
+
+    Objects are downloaded to cache_dir the first time they are read so that
+    they can be memory-mapped; later reads on the same instance are served from
+    local disk. Stored objects are never modified, so cached copies cannot go
+    stale. The least recently used files are evicted once the cache grows past
+    max_bytes.
+    """
+
+    def __init__(self, backend: StorageBackend, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key.replace("/", "__"))
+
+    def store(self, key: str, file_path: str):
+        """Uploads a file to the backend and keeps a local copy for later reads."""
+        self.backend.upload_file(key, file_path)
+        if self.backend.local_path(key) is None:
+            shutil.copyfile(file_path, self._cache_path(key))
+            self._evict()
+
+    def fetch(self, key: str) -> str:
+        """Returns a local path holding the object, or None if it does not exist."""
+        local_path = self.backend.local_path(key)
+        if local_path is not None:
+            return local_path if os.path.exists(local_path) else None
+
+        cache_path = self._cache_path(key)
+        if os.path.exists(cache_path):
+            os.utime(cache_path)
+            return cache_path
+
+        tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+        if not self.backend.download_file(key, tmp_path):
+            return None
+        os.replace(tmp_path, cache_path)
+        logger.info(f"Cached {key} locally at {cache_path}")
+        self._evict()
+        return cache_path
+
+    def delete(self, key: str):
+        """Removes an object from the backend and the local cache."""
+        self.backend.delete(key)
+        try:
+            os.remove(self._cache_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
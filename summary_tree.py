@@ -0,0 +1,182 @@
+import re
+import math
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Words that mark a question as being about the document as a whole. Words that
+# also occur in detail questions ("main panel", "key box", "describe the roof
+# framing") are left out.
+BROAD_QUESTION_WORDS = {
+    "summary", "summarize", "summarise", "overview", "overall", "purpose", "highlights",
+}
+
+STOP_WORDS = {
+    "the", "and", "for", "are", "was", "what", "which", "this", "that", "with",
+    "from", "does", "have", "has", "there", "their", "any", "how", "when",
+    "where", "who", "why", "can", "should", "will", "would", "could", "may",
+    "document", "permit", "please", "about", "into", "than", "then", "them",
+}
+
+MAX_LEAF_TERMS = 2000
+
+LEAF_PROMPT = """Summarize the following pages of a building permit document. Keep every permit number, address, parcel, name, date, dimension, code citation and condition that a reviewer might ask about.
+
+Pages {start_page}-{end_page}:
+{text}"""
+
+GROUP_PROMPT = """The following are summaries of consecutive parts of a building permit document. Combine them into a single summary of pages {start_page}-{end_page}, keeping the most important permit details, requirements and conditions.
+
+{text}"""
+
+
+def tokenize(text: str) -> list:
+    """Lowercases text and returns its word tokens, dropping stop words and very short words."""
+    return [t for t in re.findall(r"[a-z0-9][a-z0-9\-\.]*[a-z0-9]|[a-z0-9]", text.lower())
+            if len(t) >= 3 and t not in STOP_WORDS]
+
+
+def leaf_terms(text: str) -> list:
+    """Returns the distinct terms of a chunk, most frequent first, capped at MAX_LEAF_TERMS."""
+    counts = {}
+    for token in tokenize(text):
+        counts[token] = counts.get(token, 0) + 1
+    return sorted(counts, key=lambda t: (-counts[t], t))[:MAX_LEAF_TERMS]
+
+
+def build_summary_tree(pages: list, summarize, pages_per_chunk: int = 10, fan_out: int = 8, max_workers: int = 8) -> dict:
+    """
+    Builds a hierarchical summary tree over a document with a map-reduce pass.
+
+    Leaves summarize consecutive chunks of pages; every higher level summarizes
+    groups of fan_out nodes from the level below, until a single root remains.
+
+    Args:
+        pages: List of page texts
+        summarize: Callable taking a prompt and returning the summary text
+        pages_per_chunk: Number of pages summarized by each leaf
+        fan_out: Number of child nodes summarized by each higher-level node
+        max_workers: Number of summaries requested in parallel
+
+    Returns:
+        A dict with a "levels" list; levels[0] holds the leaves and levels[-1]
+        holds the root. Every node has "start_page", "end_page" and "summary";
+        leaves also carry the "terms" used to route detail questions.
+    """
+    chunks = []
+    for start in range(0, len(pages), pages_per_chunk):
+        end = min(start + pages_per_chunk, len(pages))
+        chunks.append((start, end, "".join(pages[start:end])))
+    logger.info(f"Building summary tree over {len(pages)} pages in {len(chunks)} chunks")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Map: summarize each chunk of pages
+        summaries = list(executor.map(
+            lambda chunk: summarize(LEAF_PROMPT.format(start_page=chunk[0] + 1, end_page=chunk[1], text=chunk[2])),
+            chunks
+        ))
+        level = [
+            {"start_page": start, "end_page": end, "summary": summary, "terms": leaf_terms(text)}
+            for (start, end, text), summary in zip(chunks, summaries)
+        ]
+        levels = [level]
+
+        # Reduce: summarize groups of summaries until a single root is left
+        while len(level) > 1:
+            groups = [level[i:i + fan_out] for i in range(0, len(level), fan_out)]
+            summaries = list(executor.map(
+                lambda group: summarize(GROUP_PROMPT.format(
+                    start_page=group[0]["start_page"] + 1,
+                    end_page=group[-1]["end_page"],
+                    text="\n\n".join(node["summary"] for node in group)
+                )),
+                groups
+            ))
+            level = [
+                {"start_page": group[0]["start_page"], "end_page": group[-1]["end_page"], "summary": summary}
+                for group, summary in zip(groups, summaries)
+            ]
+            levels.append(level)
+
+    logger.info(f"Built summary tree with {len(levels)} levels")
+    return {"levels": levels}
+
+
+def is_broad_question(question: str) -> bool:
+    """Returns True if the question asks about the document as a whole rather than a detail."""
+    words = set(re.findall(r"[a-z]+", question.lower()))
+    return bool(words & BROAD_QUESTION_WORDS)
+
+
+def _format_node(node: dict) -> str:
+    return f"[Summary of pages {node['start_page'] + 1}-{node['end_page']}]\n{node['summary']}"
+
+
+def select_context(tree: dict, question: str, read_pages, max_chars: int) -> str:
+    """
+    Builds the prompt context for a question from a summary tree.
+
+    Broad questions are answered from the most detailed levels of the tree
+    that fit in max_chars; when some leaves also match the question, the
+    summaries get half the budget and the matching pages fill the rest.
+    Detail questions get the root summary plus the original pages of the
+    leaves whose terms best match the question.
+
+    Args:
+        tree: Summary tree returned by build_summary_tree
+        question: The user's question
+        read_pages: Callable (start_page, end_page) -> text of that page range
+        max_chars: Upper bound on the size of the returned context
+
+    Returns:
+        The context text to put into the prompt
+    """
+    levels = tree["levels"]
+    root = levels[-1]
+    parts = [_format_node(node) for node in root]
+    used = sum(len(part) for part in parts)
+
+    # Rank leaves by how many of the question's terms they contain, weighted by rarity
+    leaves = levels[0]
+    question_terms = set(tokenize(question))
+    leaf_term_sets = [set(leaf.get("terms", [])) for leaf in leaves]
+    document_frequency = {}
+    for terms in leaf_term_sets:
+        for term in question_terms & terms:
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+    scores = [
+        sum(math.log(1 + len(leaves) / document_frequency[term]) for term in question_terms & terms)
+        for terms in leaf_term_sets
+    ]
+    matching = sorted((i for i in range(len(leaves)) if scores[i] > 0), key=lambda i: (-scores[i], i))
+
+    if is_broad_question(question) or not matching:
+        # Walk down from the root, replacing each level with the more detailed one below while it fits
+        summary_budget = max_chars // 2 if matching else max_chars
+        for level in reversed(levels[:-1]):
+            candidate = [_format_node(node) for node in level]
+            size = sum(len(part) for part in candidate)
+            if size > summary_budget:
+                break
+            parts, used = candidate, size
+        if not matching:
+            return "\n\n".join(parts)
+
+    # Add the original pages of the best matching leaves, in page order
+    excerpts = {}
+    for index in matching:
+        leaf = leaves[index]
+        excerpt = f"[Pages {leaf['start_page'] + 1}-{leaf['end_page']}]\n{read_pages(leaf['start_page'], leaf['end_page'])}"
+        if used + len(excerpt) > max_chars:
+            # Fall back to the leaf summary if the full pages do not fit
+            excerpt = _format_node(leaf)
+            if used + len(excerpt) > max_chars:
+                continue
+        excerpts[index] = excerpt
+        used += len(excerpt)
+
+    logger.info(f"Selected {len(excerpts)} leaf excerpts for question ({used} chars)")
+    return "\n\n".join(parts + [excerpts[index] for index in sorted(excerpts)])
@@ -1,6 +1,15 @@
+import io
 import os
+import json
+import uuid
+import time
+import hashlib
 import unittest
+import threading
+from unittest import mock
+import app as app_module
 from app import app, process_document, store_document_content, get_document_content
+from scheduler import SchedulerSaturated
 import tempfile
 import shutil
 
@@ -96,5 +105,306 @@ class TestDocumentProcessing(unittest.TestCase):
         print(f"\nQuestion: {question}")
         print(f"Answer: {data['answer']}")
 
+class TestChunkedUploadRoutes(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment with Document AI replaced by a canned result."""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.content = b"%PDF-1.4 " + os.urandom(600 * 1024)
+        patcher = mock.patch.object(
+            app_module, 'process_document',
+            return_value=("Permit 2022-4227 for a detached garage.", 1, [0], [])
+        )
+        self.process_document = patcher.start()
+        self.addCleanup(patcher.stop)
+        # The tests run on one instance, so local storage is shared by every request
+        patcher = mock.patch.object(app_module, 'CHUNKED_UPLOADS_ENABLED', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start_upload(self):
+        response = self.client.post('/uploads', json={
+            'filename': 'plans.pdf', 'size': len(self.content), 'chunk_size': 256 * 1024
+        })
+        self.assertEqual(response.status_code, 201, response.get_json())
+        return response.get_json()
+
+    def send_chunks(self, manifest, indexes):
+        chunk_size = manifest['chunk_size']
+        for index in indexes:
+            chunk = self.content[index * chunk_size:(index + 1) * chunk_size]
+            response = self.client.put(
+                f"/uploads/{manifest['upload_id']}/chunks/{index}",
+                data=chunk,
+                headers={'X-Chunk-SHA256': hashlib.sha256(chunk).hexdigest()}
+            )
+            self.assertEqual(response.status_code, 200, response.get_json())
+
+    def test_chunked_upload_flow(self):
+        """Test starting, sending chunks, resuming from status and completing an upload."""
+        manifest = self.start_upload()
+        self.assertEqual(manifest['total_chunks'], 3)
+        upload_id = manifest['upload_id']
+
+        self.send_chunks(manifest, [2, 0])
+        status = self.client.get(f"/uploads/{upload_id}").get_json()
+        self.assertEqual(status['received'], [0, 2])
+
+        response = self.client.post(f"/uploads/{upload_id}/complete")
+        self.assertEqual(response.status_code, 409)
+
+        self.send_chunks(manifest, [1])
+        response = self.client.post(f"/uploads/{upload_id}/complete")
+        self.assertEqual(response.status_code, 200, response.get_json())
+        self.assertIn('document_id', response.get_json())
+        self.assertEqual(self.process_document.call_count, 1)
+
+        # The session is removed once the document has been processed
+        self.assertEqual(self.client.get(f"/uploads/{upload_id}").status_code, 404)
+
+    def test_invalid_chunk_size(self):
+        """Test that a non-numeric chunk size is rejected as a bad request."""
+        response = self.client.post('/uploads', json={'filename': 'plans.pdf', 'size': 1000, 'chunk_size': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_chunk_without_content_length(self):
+        """Test that a chunk sent without a Content-Length is refused before its body is read."""
+        manifest = self.start_upload()
+        environ = {'wsgi.input_terminated': True}
+        response = self.client.put(
+            f"/uploads/{manifest['upload_id']}/chunks/0",
+            data=self.content[:1024],
+            headers={'Transfer-Encoding': 'chunked'},
+            environ_base=environ
+        )
+        self.assertEqual(response.status_code, 411)
+
+    def test_disabled_without_shared_storage(self):
+        """Test that the chunked protocol is refused when chunks could land on different instances."""
+        with mock.patch.object(app_module, 'CHUNKED_UPLOADS_ENABLED', False):
+            response = self.client.post('/uploads', json={'filename': 'plans.pdf', 'size': 1000})
+            self.assertEqual(response.status_code, 501)
+            self.assertIn(b"CHUNKED_UPLOADS = false", self.client.get('/').data)
+
+    def test_complete_when_saturated(self):
+        """Test that completing while extraction is saturated returns 503 with Retry-After and keeps the upload."""
+        manifest = self.start_upload()
+        self.send_chunks(manifest, range(manifest['total_chunks']))
+
+        with mock.patch.object(
+            app_module.extraction_scheduler, 'slot',
+            side_effect=SchedulerSaturated("Document processing is at capacity", 7)
+        ):
+            response = self.client.post(f"/uploads/{manifest['upload_id']}/complete")
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '7')
+        self.assertEqual(response.get_json()['retry_after'], 7)
+        self.assertEqual(self.client.get(f"/uploads/{manifest['upload_id']}").get_json()['received'], [0, 1, 2])
+
+class TestRequestCoalescing(unittest.TestCase):
+    def setUp(self):
+        """Set up a test client and a remote call that blocks until released."""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.tenant = str(uuid.uuid4())
+
+    def blocking_call(self, result=None, error=None):
+        """Return a stand-in for a remote call that counts calls and waits for release."""
+        def call(*args, **kwargs):
+            self.calls += 1
+            self.started.set()
+            self.release.wait(5)
+            if error:
+                raise error
+            return result
+        return call
+
+    def run_pair(self, first, second):
+        """Run two requests so the second arrives while the first is in flight."""
+        responses = [None, None]
+
+        def run(index, send):
+            responses[index] = send()
+
+        leader = threading.Thread(target=run, args=(0, first))
+        follower = threading.Thread(target=run, args=(1, second))
+        leader.start()
+        self.assertTrue(self.started.wait(5))
+        follower.start()
+        # Give the follower time to join the in-flight call before it finishes
+        time.sleep(0.3)
+        self.release.set()
+        leader.join(5)
+        follower.join(5)
+        return responses
+
+    def upload(self, content, filename):
+        def send():
+            return app.test_client().post(
+                '/upload',
+                data={'file': (io.BytesIO(content), filename)},
+                content_type='multipart/form-data',
+                headers={'X-Forwarded-For': self.tenant}
+            )
+        return send
+
+    def ask(self, document_id, question):
+        def send():
+            return app.test_client().post('/ask', json={'document_id': document_id, 'question': question})
+        return send
+
+    def saved_files(self, *filenames):
+        return [name for _, _, names in os.walk(app_module.TEMP_DIR) for name in names if name in filenames]
+
+    def test_identical_uploads_share_one_extraction(self):
+        """Test that a concurrent identical upload reuses the leader's document but keeps its own filename."""
+        content = b"%PDF-1.4 " + os.urandom(1024)
+        call = self.blocking_call(result=("Permit 2022-4227.", 1, [0], []))
+        with mock.patch.object(app_module, 'process_document', side_effect=call):
+            first, second = self.run_pair(self.upload(content, 'plans_a.pdf'), self.upload(content, 'plans_b.pdf'))
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.get_json()['document_id'], second.get_json()['document_id'])
+        self.assertEqual(first.get_json()['filename'], 'plans_a.pdf')
+        self.assertEqual(second.get_json()['filename'], 'plans_b.pdf')
+        # Neither copy of the upload is left behind
+        self.assertEqual(self.saved_files('plans_a.pdf', 'plans_b.pdf'), [])
+
+    def test_upload_error_reaches_both_callers(self):
+        """Test that a failed extraction is reported to the request that joined it."""
+        content = b"%PDF-1.4 " + os.urandom(1024)
+        call = self.blocking_call(error=RuntimeError("Document AI unavailable"))
+        with mock.patch.object(app_module, 'process_document', side_effect=call):
+            first, second = self.run_pair(self.upload(content, 'plans_a.pdf'), self.upload(content, 'plans_b.pdf'))
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.status_code, 500)
+        self.assertEqual(second.status_code, 500)
+
+    def test_identical_questions_share_one_answer(self):
+        """Test that the same question, spelled differently, is answered with one Gemini call."""
+        document_id = store_document_content("Permit 2022-4227 for a detached garage.", "garage.pdf", [0])
+        model = mock.Mock()
+        model.generate_content.side_effect = self.blocking_call(result=mock.Mock(text="The permit number is 2022-4227."))
+        with mock.patch.object(app_module.genai, 'GenerativeModel', return_value=model):
+            first, second = self.run_pair(
+                self.ask(document_id, "What is the permit number?"),
+                self.ask(document_id, "  what is the PERMIT number ")
+            )
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.get_json()['answer'], "The permit number is 2022-4227.")
+        self.assertEqual(second.get_json()['answer'], "The permit number is 2022-4227.")
+
+    def test_question_error_reaches_both_callers(self):
+        """Test that a failed Gemini call is reported to the request that joined it."""
+        document_id = store_document_content("Permit 2022-4227 for a detached garage.", "garage.pdf", [0])
+        model = mock.Mock()
+        model.generate_content.side_effect = self.blocking_call(error=RuntimeError("quota exceeded"))
+        with mock.patch.object(app_module.genai, 'GenerativeModel', return_value=model):
+            first, second = self.run_pair(
+                self.ask(document_id, "What is the permit number?"),
+                self.ask(document_id, "What is the permit number?")
+            )
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(first.status_code, 429)
+        self.assertEqual(second.status_code, 429)
+
+class TestDocumentIds(unittest.TestCase):
+    def test_invalid_ids_never_reach_the_legacy_lookup(self):
+        """Test that an ID that is not a UUID cannot point the legacy lookup at a file outside TEMP_DIR."""
+        outside_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside_dir)
+        with open(os.path.join(outside_dir, "secret.json"), "w") as f:
+            json.dump({"text": "secret", "expires_at": "2999-01-01T00:00:00"}, f)
+
+        document_id = os.path.join(outside_dir, "secret")
+        self.assertIsNone(get_document_content(document_id))
+        self.assertIsNone(app_module.get_question_context(document_id, "What is this?"))
+
+class TestTenantId(unittest.TestCase):
+    def test_tenant_is_the_address_cloud_run_appends(self):
+        """Test that client-supplied X-Forwarded-For entries and tenant headers are ignored."""
+        with app.test_request_context('/', headers={
+            'X-Forwarded-For': '10.0.0.1, 203.0.113.7',
+            'X-Tenant-ID': 'someone-else'
+        }):
+            self.assertEqual(app_module.get_tenant_id(), '203.0.113.7')
+
+    def test_trusted_tenant_header(self):
+        """Test that the header set by an authenticating proxy is used when configured."""
+        with mock.patch.object(app_module, 'TENANT_HEADER', 'X-Goog-Authenticated-User-Email'):
+            with app.test_request_context('/', headers={
+                'X-Goog-Authenticated-User-Email': 'accounts.google.com:reviewer@example.com',
+                'X-Forwarded-For': '203.0.113.7'
+            }):
+                self.assertEqual(app_module.get_tenant_id(), 'accounts.google.com:reviewer@example.com')
+
+class TestSearchRoute(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment."""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        patcher = mock.patch.object(app_module, 'SEARCH_ENABLED', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # A fresh tenant per test so documents stored by other tests are not visible
+        self.tenant = str(uuid.uuid4())
+        self.document_id = store_document_content(
+            "Permit 2022-4227 for a detached garage.", "garage.pdf", [0], tenant=self.tenant
+        )
+
+    def search(self, query, address):
+        return self.client.get('/search', query_string={'q': query}, headers={'X-Forwarded-For': address})
+
+    def test_search_is_scoped_to_tenant(self):
+        """Test that callers only find their own documents, with snippets."""
+        data = self.search('"detached garage"', self.tenant).get_json()
+        self.assertEqual([r['document_id'] for r in data['results']], [self.document_id])
+        self.assertIn('detached garage', data['results'][0]['snippet'])
+
+        data = self.search('"detached garage"', str(uuid.uuid4())).get_json()
+        self.assertEqual(data['total'], 0)
+
+    def test_search_does_not_read_storage(self):
+        """Test that building results never opens stored documents."""
+        with mock.patch.object(app_module, 'open_document') as open_document:
+            response = self.search('garage', self.tenant)
+        self.assertEqual(response.status_code, 200)
+        open_document.assert_not_called()
+
+    def test_sync_indexes_documents_from_other_instances(self):
+        """Test that the sync picks up stored documents this instance has not indexed."""
+        app_module.search_index.remove_document(self.document_id)
+        app_module.search_index_synced.pop(self.document_id)
+        with mock.patch.object(app_module.document_cache, 'fetch') as fetch:
+            app_module.sync_search_index()
+        fetch.assert_not_called()
+        self.assertIn(self.document_id, app_module.search_index)
+        self.assertEqual(self.search('4227', self.tenant).get_json()['total'], 1)
+
+    def test_invalid_search(self):
+        """Test that bad queries and paging are rejected."""
+        self.assertEqual(self.client.get('/search').status_code, 400)
+        self.assertEqual(self.client.get('/search?q=garage&page_size=500').status_code, 400)
+
+    def test_unknown_field_is_searched_as_text(self):
+        """Test that a word before a colon that is not a field is not rejected."""
+        response = self.search('owner:smith', self.tenant)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['total'], 0)
+
+    def test_disabled_without_tenant_header(self):
+        """Test that search is off unless it is enabled."""
+        with mock.patch.object(app_module, 'SEARCH_ENABLED', False):
+            self.assertEqual(self.search('garage', self.tenant).status_code, 501)
+
 if __name__ == '__main__':
-    unittest.main() 
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import hashlib
+import unittest
+import tempfile
+import shutil
+from datetime import datetime, timedelta
+from chunked_upload import UploadSessionError, UploadSessionStore
+from storage_backend import InMemoryStorageBackend
+
+CHUNK_SIZE = 256 * 1024
+
+class TestChunkedUpload(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment."""
+        self.test_dir = tempfile.mkdtemp()
+        self.backend = InMemoryStorageBackend()
+        self.sessions = UploadSessionStore(self.backend, max_upload_bytes=10 * 1024 * 1024)
+        self.content = os.urandom(CHUNK_SIZE * 2 + 1000)
+
+    def tearDown(self):
+        """Clean up test environment."""
+        shutil.rmtree(self.test_dir)
+
+    def chunk(self, index):
+        return self.content[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+
+    def test_out_of_order_upload_and_resume(self):
+        """Test that chunks can arrive in any order and the status reports what is missing."""
+        manifest = self.sessions.create("plans.pdf", len(self.content), CHUNK_SIZE)
+        upload_id = manifest["upload_id"]
+        self.assertEqual(manifest["total_chunks"], 3)
+
+        self.sessions.put_chunk(upload_id, 2, self.chunk(2), hashlib.sha256(self.chunk(2)).hexdigest())
+        self.sessions.put_chunk(upload_id, 0, self.chunk(0))
+        self.assertEqual(self.sessions.status(upload_id)["received"], [0, 2])
+
+        with self.assertRaises(UploadSessionError) as context:
+            self.sessions.assemble(upload_id, os.path.join(self.test_dir, "plans.pdf"))
+        self.assertEqual(context.exception.status_code, 409)
+
+        self.sessions.put_chunk(upload_id, 1, self.chunk(1))
+        output_path = os.path.join(self.test_dir, "plans.pdf")
+        result = self.sessions.assemble(upload_id, output_path)
+        with open(output_path, "rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(result["sha256"], hashlib.sha256(self.content).hexdigest())
+
+        self.sessions.delete(upload_id)
+        self.assertEqual(self.backend.objects, {})
+
+    def test_rejects_bad_chunks(self):
+        """Test checksum, size and index validation."""
+        upload_id = self.sessions.create("plans.pdf", len(self.content), CHUNK_SIZE)["upload_id"]
+        cases = [
+            (0, self.chunk(0), "0" * 64, 422),
+            (0, self.chunk(0)[:-1], None, 400),
+            (3, self.chunk(2), None, 400),
+        ]
+        for index, data, checksum, status_code in cases:
+            with self.assertRaises(UploadSessionError) as context:
+                self.sessions.put_chunk(upload_id, index, data, checksum)
+            self.assertEqual(context.exception.status_code, status_code)
+        self.assertEqual(self.sessions.status(upload_id)["received"], [])
+
+    def test_rejects_bad_sessions(self):
+        """Test size limits and unknown upload IDs."""
+        with self.assertRaises(UploadSessionError) as context:
+            self.sessions.create("plans.pdf", 20 * 1024 * 1024)
+        self.assertEqual(context.exception.status_code, 413)
+        with self.assertRaises(UploadSessionError):
+            self.sessions.create("plans.pdf", 0)
+        with self.assertRaises(UploadSessionError) as context:
+            self.sessions.get_manifest("00000000-0000-0000-0000-000000000000")
+        self.assertEqual(context.exception.status_code, 404)
+        with self.assertRaises(UploadSessionError):
+            self.sessions.get_manifest("../documents")
+
+    def test_invalid_chunk_size_is_rejected(self):
+        """Test that a non-numeric chunk size is a client error."""
+        for chunk_size in ("abc", -1, 1.5):
+            with self.assertRaises(UploadSessionError) as context:
+                self.sessions.create("plans.pdf", len(self.content), chunk_size)
+            self.assertEqual(context.exception.status_code, 400)
+
+    def test_prune_expired_sessions(self):
+        """Test that expired sessions and orphaned chunks are removed and live sessions are kept."""
+        live = self.sessions.create("plans.pdf", len(self.content), CHUNK_SIZE)["upload_id"]
+        expired = self.sessions.create("old.pdf", len(self.content), CHUNK_SIZE)["upload_id"]
+        self.sessions.put_chunk(live, 0, self.chunk(0))
+        self.sessions.put_chunk(expired, 0, self.chunk(0))
+        self.backend.put("uploads/orphan/chunks/000000", b"x")
+
+        self.assertEqual(self.sessions.prune_expired(datetime.now() + timedelta(hours=1)), ["orphan"])
+        self.assertEqual(self.sessions.status(live)["received"], [0])
+        self.assertEqual(sorted(self.sessions.prune_expired(datetime.now() + timedelta(hours=25))), sorted([live, expired]))
+        self.assertEqual(self.backend.list_keys("uploads/"), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import unittest
+from unittest import mock
+import tempfile
+import shutil
+from google.cloud import documentai_v1 as documentai
+from PyPDF2 import PdfWriter
+from doc_extract import ExtractionResult, RESPONSE_FIELDS, get_page_offsets, process_document_with_docai
+
+PAGE_TEXTS = ["Permit 2022-4227\n", "", "Detached garage\n"]
+
+def page(start, end):
+    """Build a Document AI page whose layout covers text[start:end], or no text when start is None."""
+    if start is None:
+        return documentai.Document.Page()
+    segment = documentai.Document.TextAnchor.TextSegment(start_index=start, end_index=end)
+    return documentai.Document.Page(
+        layout=documentai.Document.Page.Layout(text_anchor=documentai.Document.TextAnchor(text_segments=[segment]))
+    )
+
+def make_document():
+    """A three-page response whose middle page (a blank or photo page) has no text segments."""
+    first, third = PAGE_TEXTS[0], PAGE_TEXTS[2]
+    return documentai.Document(
+        text=first + third,
+        pages=[page(0, len(first)), page(None, None), page(len(first), len(first) + len(third))]
+    )
+
+class TestDocExtract(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment."""
+        self.test_dir = tempfile.mkdtemp()
+        self.pdf_path = os.path.join(self.test_dir, "permit.pdf")
+        writer = PdfWriter()
+        for _ in PAGE_TEXTS:
+            writer.add_blank_page(width=612, height=792)
+        with open(self.pdf_path, "wb") as f:
+            writer.write(f)
+
+    def tearDown(self):
+        """Clean up test environment."""
+        shutil.rmtree(self.test_dir)
+
+    def test_get_page_offsets(self):
+        """Test that a page without text segments starts where the previous page ended."""
+        self.assertEqual(get_page_offsets(make_document()), [0, 17, 17])
+
+    def test_request_and_result(self):
+        """Test that the request asks only for text and page layouts and a plain ExtractionResult comes back."""
+        with mock.patch("doc_extract.documentai.DocumentProcessorServiceClient") as client_class:
+            client = client_class.return_value
+            client.processor_path.return_value = "projects/p/locations/us/processors/x"
+            client.process_document.return_value = documentai.ProcessResponse(document=make_document())
+            result = process_document_with_docai("p", "us", "x", self.pdf_path, "application/pdf")
+
+        request = client.process_document.call_args.kwargs["request"]
+        self.assertEqual(list(request.field_mask.paths), ["text", "pages.layout"])
+        self.assertEqual(list(request.field_mask.paths), RESPONSE_FIELDS)
+
+        self.assertIsInstance(result, ExtractionResult)
+        self.assertEqual(result.text, "".join(PAGE_TEXTS))
+        self.assertEqual(result.page_count, 3)
+        self.assertEqual(result.page_offsets, [0, 17, 17])
+        self.assertEqual(result.sections, [{"title": "permit.pdf", "start_page": 0, "end_page": 3}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import unittest
+import tempfile
+import shutil
+from doc_store import DocumentReader, read_header, split_pages, write_document
+
+class TestDocumentStore(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment."""
+        self.test_dir = tempfile.mkdtemp()
+        self.doc_path = os.path.join(self.test_dir, "doc.bpd")
+        self.pages = [f"Page {i} - SITE PLAN, 721 Glencoe Ct\n" * 20 for i in range(10)]
+        self.metadata = {"filename": "permit.pdf", "expires_at": "2099-01-01T00:00:00"}
+
+    def tearDown(self):
+        """Clean up test environment."""
+        shutil.rmtree(self.test_dir)
+
+    def test_split_pages(self):
+        """Test splitting text on page offsets."""
+        self.assertEqual(split_pages("aaabbc", [0, 3, 5]), ["aaa", "bb", "c"])
+        self.assertEqual(split_pages("aaabbc", [0, 3, 3, 5]), ["aaa", "", "bb", "c"])
+        self.assertEqual(split_pages("aaabbc", [1, 3]), ["aaa", "bbc"])
+        self.assertEqual(split_pages("aaabbc", []), ["aaabbc"])
+
+    def test_round_trip(self):
+        """Test that the full text and page ranges survive a write and read."""
+        sections = [{"title": "part_1", "start_page": 0, "end_page": 10}]
+        write_document(self.doc_path, self.pages, self.metadata, sections)
+
+        with DocumentReader(self.doc_path) as reader:
+            self.assertEqual(reader.page_count, 10)
+            self.assertEqual(reader.metadata, self.metadata)
+            self.assertEqual(reader.sections, sections)
+            self.assertEqual(reader.read_text(), "".join(self.pages))
+            self.assertEqual(reader.read_pages(3, 5), self.pages[3:5])
+            self.assertEqual(reader.read_page(9), self.pages[9])
+
+    def test_compressed_on_disk(self):
+        """Test that the stored file is smaller than the raw text."""
+        size = write_document(self.doc_path, self.pages, self.metadata)
+        self.assertEqual(size, os.path.getsize(self.doc_path))
+        self.assertLess(size, len("".join(self.pages).encode("utf-8")))
+
+    def test_read_header_only(self):
+        """Test reading metadata without decoding page data."""
+        write_document(self.doc_path, self.pages, self.metadata)
+        header = read_header(self.doc_path)
+        self.assertEqual(header["metadata"]["filename"], "permit.pdf")
+        self.assertEqual(len(header["pages"]), 10)
+
+    def test_rejects_other_files(self):
+        """Test that files in another format are rejected."""
+        with open(self.doc_path, "wb") as f:
+            f.write(b'{"text": "legacy json document"}')
+        with self.assertRaises(ValueError):
+            DocumentReader(self.doc_path)
+
+if __name__ == '__main__':
+    unittest.main()
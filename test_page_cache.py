@@ -0,0 +1,156 @@
+import os
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
+import tempfile
+import shutil
+from PyPDF2 import PageObject, PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject
+from page_cache import PageTextCache, fingerprint_pages
+from doc_extract import process_document_with_docai
+
+def write_pdf(path, page_contents, stamps=None):
+    """Write a PDF with one blank page per content stream, adding stamp annotations to pages listed in stamps."""
+    writer = PdfWriter()
+    for index, content in enumerate(page_contents):
+        page = PageObject.create_blank_page(width=612, height=792)
+        stream = DecodedStreamObject()
+        stream.set_data(content)
+        page[NameObject("/Contents")] = stream
+        if stamps and index in stamps:
+            appearance = DecodedStreamObject()
+            appearance.set_data(stamps[index])
+            page[NameObject("/Annots")] = ArrayObject([DictionaryObject({
+                NameObject("/Type"): NameObject("/Annot"),
+                NameObject("/Subtype"): NameObject("/Stamp"),
+                NameObject("/AP"): DictionaryObject({NameObject("/N"): writer._add_object(appearance)}),
+            })])
+        writer.add_page(page)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+def fake_process_chunk(client, resource_name, file_path, mime_type):
+    """Stand in for Document AI: each page's text is its content stream."""
+    return [page.get_contents().get_data().decode() + "\n" for page in PdfReader(file_path).pages]
+
+class TestPageCache(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment."""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up test environment."""
+        shutil.rmtree(self.test_dir)
+
+    def test_fingerprints_match_unchanged_pages(self):
+        """Test that only changed pages of a revision get new fingerprints."""
+        original = os.path.join(self.test_dir, "permit.pdf")
+        revision = os.path.join(self.test_dir, "permit_revision_01.pdf")
+        write_pdf(original, [b"BT (Site plan) Tj ET", b"BT (Floor plan) Tj ET", b"BT (Notes) Tj ET"])
+        write_pdf(revision, [b"BT (Cover letter) Tj ET", b"BT (Site plan) Tj ET", b"BT (Floor plan rev 1) Tj ET", b"BT (Notes) Tj ET"])
+
+        original_fps = fingerprint_pages(original)
+        revision_fps = fingerprint_pages(revision)
+        self.assertEqual(len(set(original_fps)), 3)
+        self.assertEqual(revision_fps[1], original_fps[0])
+        self.assertEqual(revision_fps[3], original_fps[2])
+        self.assertNotIn(revision_fps[0], original_fps)
+        self.assertNotIn(revision_fps[2], original_fps)
+
+    def test_new_markups_change_the_fingerprint(self):
+        """Test that a reviewer stamp added to an otherwise unchanged page gives it a new fingerprint."""
+        original = os.path.join(self.test_dir, "permit.pdf")
+        revision = os.path.join(self.test_dir, "permit_revision_01.pdf")
+        write_pdf(original, [b"BT (Site plan) Tj ET", b"BT (Notes) Tj ET"])
+        write_pdf(revision, [b"BT (Site plan) Tj ET", b"BT (Notes) Tj ET"], stamps={1: b"BT (REVISE AND RESUBMIT) Tj ET"})
+
+        original_fps = fingerprint_pages(original)
+        revision_fps = fingerprint_pages(revision)
+        self.assertEqual(revision_fps[0], original_fps[0])
+        self.assertNotEqual(revision_fps[1], original_fps[1])
+
+    def test_cache_round_trip(self):
+        """Test storing and retrieving page text."""
+        cache = PageTextCache(os.path.join(self.test_dir, "cache"))
+        self.assertIsNone(cache.get("processor:abc"))
+        cache.put("processor:abc", "SITE PLAN\n")
+        self.assertEqual(cache.get("processor:abc"), "SITE PLAN\n")
+
+    def test_expired_entries_are_misses(self):
+        """Test that page text is not served or kept past the TTL."""
+        cache = PageTextCache(os.path.join(self.test_dir, "cache"), ttl=timedelta(hours=24))
+        cache.put("processor:abc", "SITE PLAN\n")
+        path = cache._path("processor:abc")
+        old = time.time() - 25 * 3600
+        os.utime(path, (old, old))
+        self.assertIsNone(cache.get("processor:abc"))
+        self.assertFalse(os.path.exists(path))
+
+    def test_oldest_entries_are_evicted_past_max_bytes(self):
+        """Test that the cache stays within max_bytes by dropping the oldest entries."""
+        cache = PageTextCache(os.path.join(self.test_dir, "cache"), max_bytes=250)
+        for i in range(5):
+            cache.put(f"processor:{i}", "x" * 100)
+            old = time.time() - 100 + i
+            os.utime(cache._path(f"processor:{i}"), (old, old))
+        cache.prune()
+        self.assertIsNone(cache.get("processor:0"))
+        self.assertEqual(cache.get("processor:4"), "x" * 100)
+        self.assertLessEqual(cache.prune(), 250)
+
+    def test_unreadable_pdf_skips_cache(self):
+        """Test that a PDF PyPDF2 cannot read is still sent to Document AI when the cache is on."""
+        path = os.path.join(self.test_dir, "truncated.pdf")
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\n")
+        cache = PageTextCache(os.path.join(self.test_dir, "cache"))
+
+        with mock.patch("doc_extract.documentai.DocumentProcessorServiceClient"), \
+                mock.patch("doc_extract.process_chunk", return_value=["Page text\n"]) as process_chunk:
+            result = process_document_with_docai("project", "us", "processor", path, "application/pdf", page_cache=cache)
+
+        self.assertEqual(process_chunk.call_count, 1)
+        self.assertEqual(result.text, "Page text\n")
+
+    def test_revision_sends_only_uncached_pages(self):
+        """Test that a revision sends only new pages to Document AI and merges all pages back in order."""
+        original = os.path.join(self.test_dir, "permit.pdf")
+        revision = os.path.join(self.test_dir, "permit_revision_01.pdf")
+        write_pdf(original, [b"Site plan", b"Floor plan", b"Notes"])
+        write_pdf(revision, [b"Cover letter", b"Site plan", b"Floor plan rev 1", b"Notes"])
+        cache = PageTextCache(os.path.join(self.test_dir, "cache"))
+
+        sent_pages = []
+        def process_chunk(client, resource_name, file_path, mime_type):
+            texts = fake_process_chunk(client, resource_name, file_path, mime_type)
+            sent_pages.append(texts)
+            return texts
+
+        with mock.patch("doc_extract.documentai.DocumentProcessorServiceClient"), \
+                mock.patch("doc_extract.process_chunk", side_effect=process_chunk):
+            process_document_with_docai("project", "us", "processor", original, "application/pdf", page_cache=cache)
+            result = process_document_with_docai("project", "us", "processor", revision, "application/pdf", page_cache=cache)
+
+        self.assertEqual(sent_pages[1], ["Cover letter\n", "Floor plan rev 1\n"])
+        self.assertEqual(result.text, "Cover letter\nSite plan\nFloor plan rev 1\nNotes\n")
+        self.assertEqual(result.page_count, 4)
+        self.assertEqual(result.page_offsets, [0, 13, 23, 40])
+        self.assertEqual([section["title"] for section in result.sections],
+                         ["permit_revision_01_uncached.pdf", "page cache", "permit_revision_01_uncached.pdf", "page cache"])
+
+    def test_page_count_mismatch_is_not_cached(self):
+        """Test that texts are not cached when Document AI returns a different number of pages than were sent."""
+        path = os.path.join(self.test_dir, "permit.pdf")
+        write_pdf(path, [b"Site plan", b"Floor plan", b"Notes"])
+        cache = PageTextCache(os.path.join(self.test_dir, "cache"))
+
+        with mock.patch("doc_extract.documentai.DocumentProcessorServiceClient"), \
+                mock.patch("doc_extract.process_chunk", return_value=["Site plan\n", "Notes\n"]):
+            result = process_document_with_docai("project", "us", "processor", path, "application/pdf", page_cache=cache)
+
+        self.assertEqual(result.page_count, 3)
+        self.assertTrue(all(cache.get(f"processor:{fingerprint}") is None for fingerprint in fingerprint_pages(path)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import unittest
+import tempfile
+import shutil
+from PIL import Image, ImageDraw
+from PyPDF2 import PdfReader
+from preprocess import get_mime_type, preprocess_document
+from doc_extract import count_pages
+
+def make_scan(width=3400, height=4400):
+    """Create a colour page image with some text on it."""
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(0, height, 40):
+        draw.text((100, y), "PERMIT 2022-4227 721 GLENCOE CT " * 10, fill=(90, 0, 0))
+    return image
+
+class TestPreprocess(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment."""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up test environment."""
+        shutil.rmtree(self.test_dir)
+
+    def test_get_mime_type(self):
+        """Test supported and unsupported extensions."""
+        self.assertEqual(get_mime_type("plans.PDF"), "application/pdf")
+        self.assertEqual(get_mime_type("IMG_0042.jpeg"), "image/jpeg")
+        self.assertEqual(get_mime_type("scan.tif"), "image/tiff")
+        self.assertIsNone(get_mime_type("notes.docx"))
+
+    def test_photo_is_shrunk(self):
+        """Test that a large colour photo is converted to a smaller grayscale JPEG."""
+        path = os.path.join(self.test_dir, "photo.jpg")
+        make_scan().save(path, quality=95)
+
+        output_path, mime_type, stats = preprocess_document(path, "image/jpeg", target_dpi=150)
+        self.assertEqual(mime_type, "image/jpeg")
+        self.assertGreater(stats["bytes_saved"], 0)
+        self.assertEqual(stats["processed_bytes"], os.path.getsize(output_path))
+        with Image.open(output_path) as image:
+            self.assertEqual(image.mode, "L")
+            self.assertLessEqual(max(image.size), 150 * 17)
+
+    def test_multi_page_tiff(self):
+        """Test that every page of a multi-page TIFF is kept."""
+        path = os.path.join(self.test_dir, "scan.tiff")
+        page = make_scan(1700, 2200)
+        page.save(path, save_all=True, append_images=[page, page])
+
+        output_path, mime_type, stats = preprocess_document(path, "image/tiff")
+        self.assertEqual(mime_type, "image/tiff")
+        with Image.open(output_path) as image:
+            self.assertEqual(image.n_frames, 3)
+
+    def test_count_tiff_pages(self):
+        """Test that every frame of a multi-page TIFF counts as a page for scheduling."""
+        path = os.path.join(self.test_dir, "scan.tiff")
+        frames = [Image.new("L", (200, 260), "white") for _ in range(5)]
+        frames[0].save(path, save_all=True, append_images=frames[1:])
+        self.assertEqual(count_pages(path, "image/tiff"), 5)
+
+        png_path = os.path.join(self.test_dir, "photo.png")
+        frames[0].save(png_path)
+        self.assertEqual(count_pages(png_path, "image/png"), 1)
+
+    def test_scanned_pdf_images_downscaled(self):
+        """Test that a 600 DPI scanned PDF is rewritten with grayscale images at the target DPI."""
+        path = os.path.join(self.test_dir, "scan.pdf")
+        make_scan(5100, 6600).save(path, resolution=600)
+
+        output_path, mime_type, stats = preprocess_document(path, "application/pdf", target_dpi=300)
+        self.assertEqual(mime_type, "application/pdf")
+        self.assertGreater(stats["bytes_saved"], 0)
+        image = list(PdfReader(output_path).pages[0]["/Resources"]["/XObject"].values())[0].get_object()
+        self.assertEqual(image["/Width"], 2550)
+        self.assertEqual(image["/ColorSpace"], "/DeviceGray")
+
+    def test_keeps_original_when_not_smaller(self):
+        """Test that the original file is sent when preprocessing does not help."""
+        path = os.path.join(self.test_dir, "small.png")
+        Image.new("L", (100, 100), "white").save(path, optimize=True)
+
+        output_path, mime_type, stats = preprocess_document(path, "image/png")
+        self.assertEqual(output_path, path)
+        self.assertEqual(stats["bytes_saved"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
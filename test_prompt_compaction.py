@@ -0,0 +1,61 @@
+import unittest
+from prompt_compaction import compact_pages, estimate_tokens, find_repeated_lines
+
+HEADER = "CITY OF SPRINGFIELD BUILDING DIVISION\n"
+FOOTER = "All work shall comply with the 2022 California Building Code.\n"
+
+def make_pages(count):
+    return [
+        f"{HEADER}Page {i + 1} details: beam size {i + 4}x{i + 8}.\n{FOOTER}"
+        for i in range(count)
+    ]
+
+class TestPromptCompaction(unittest.TestCase):
+    def test_find_repeated_lines(self):
+        """Test that only lines repeated on enough pages are found."""
+        self.assertEqual(len(find_repeated_lines(make_pages(5))), 2)
+        self.assertEqual(find_repeated_lines(make_pages(2)), set())
+
+    def test_repeated_lines_are_kept_once(self):
+        """Test that headers and footers appear once while page text is kept."""
+        pages = make_pages(10)
+        compact_text, stats = compact_pages(pages)
+
+        self.assertEqual(compact_text.count("CITY OF SPRINGFIELD"), 1)
+        self.assertEqual(compact_text.count("California Building Code"), 1)
+        for i in range(10):
+            self.assertIn(f"Page {i + 1} details: beam size {i + 4}x{i + 8}.", compact_text)
+        self.assertEqual(stats["repeated_lines"], 2)
+        self.assertEqual(stats["original_chars"], len("".join(pages)))
+        self.assertEqual(stats["compact_chars"], len(compact_text))
+        self.assertLess(stats["compact_tokens"], stats["original_tokens"])
+
+    def test_matching_ignores_case_and_whitespace(self):
+        """Test that lines differing only in case or spacing count as repeats."""
+        pages = make_pages(4)
+        pages[1] = pages[1].replace(HEADER, "  City of Springfield   Building Division\n")
+        compact_text, stats = compact_pages(pages)
+        self.assertEqual(stats["repeated_lines"], 2)
+        self.assertNotIn("City of Springfield", compact_text)
+
+    def test_adjacent_repeated_lines_share_one_reference(self):
+        """Test that a run of repeated lines becomes a single reference."""
+        pages = [f"{HEADER}{FOOTER}Unique text on page {i}.\n" for i in range(4)]
+        compact_text, _ = compact_pages(pages)
+        self.assertEqual(compact_text.count("[R1-R2]\n"), 4)
+
+    def test_short_lines_are_kept(self):
+        """Test that short lines are never replaced by references."""
+        pages = ["N/A\nUnique text on page %d.\n" % i for i in range(5)]
+        compact_text, stats = compact_pages(pages)
+        self.assertEqual(compact_text, "".join(pages))
+        self.assertEqual(stats["repeated_lines"], 0)
+        self.assertEqual(stats["compact_chars"], stats["original_chars"])
+
+    def test_estimate_tokens(self):
+        """Test the rough token estimate."""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcde"), 2)
+
+if __name__ == '__main__':
+    unittest.main()
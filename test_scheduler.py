@@ -0,0 +1,93 @@
+import time
+import unittest
+import threading
+from scheduler import ExtractionScheduler, SchedulerSaturated
+
+class TestExtractionScheduler(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment."""
+        self.order = []
+        self.threads = []
+        self.release = threading.Event()
+
+    def tearDown(self):
+        """Let any remaining jobs finish."""
+        self.release.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+    def submit(self, scheduler, name, tenant, pages, hold=False):
+        """Queue a job in a background thread and wait until the scheduler has seen it."""
+        before = scheduler.stats()
+
+        def job():
+            with scheduler.slot(tenant, pages, 0):
+                self.order.append(name)
+                if hold:
+                    self.release.wait()
+
+        thread = threading.Thread(target=job)
+        thread.start()
+        self.threads.append(thread)
+        for _ in range(200):
+            stats = scheduler.stats()
+            if stats["waiting"] > before["waiting"] or stats["running"] > before["running"]:
+                break
+            time.sleep(0.01)
+
+    def finish(self):
+        self.release.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+    def test_small_jobs_first(self):
+        """Test that waiting small jobs are dispatched before a waiting large job."""
+        scheduler = ExtractionScheduler(max_concurrent=1, large_job_pages=100)
+        self.submit(scheduler, "blocker", "a", 1, hold=True)
+        self.submit(scheduler, "large", "b", 500)
+        self.submit(scheduler, "small", "c", 2)
+        self.finish()
+        self.assertEqual(self.order, ["blocker", "small", "large"])
+
+    def test_fair_between_tenants(self):
+        """Test that a tenant with a burst of jobs does not starve another tenant."""
+        scheduler = ExtractionScheduler(max_concurrent=1)
+        self.submit(scheduler, "blocker", "x", 1, hold=True)
+        for i in range(3):
+            self.submit(scheduler, f"a{i}", "a", 2)
+        self.submit(scheduler, "b0", "b", 2)
+        self.finish()
+        self.assertEqual(self.order[:3], ["blocker", "a0", "b0"])
+
+    def test_large_job_cap(self):
+        """Test that only max_large_concurrent large jobs run at once."""
+        scheduler = ExtractionScheduler(max_concurrent=3, max_large_concurrent=1, large_job_pages=100)
+        self.submit(scheduler, "large1", "a", 300, hold=True)
+        self.submit(scheduler, "large2", "b", 300, hold=True)
+        self.submit(scheduler, "small", "c", 1, hold=True)
+        stats = scheduler.stats()
+        self.assertEqual(stats["running"], 2)
+        self.assertEqual(stats["running_large"], 1)
+        self.assertEqual(stats["waiting_large"], 1)
+
+    def test_sheds_load_when_full(self):
+        """Test that jobs are rejected with a retry-after hint when the queue is full."""
+        scheduler = ExtractionScheduler(max_concurrent=1, max_queued=1, queue_timeout=5)
+        self.submit(scheduler, "blocker", "a", 1, hold=True)
+        self.submit(scheduler, "queued", "b", 1)
+        with self.assertRaises(SchedulerSaturated) as context:
+            with scheduler.slot("c", 1, 0):
+                pass
+        self.assertGreaterEqual(context.exception.retry_after, 1)
+
+    def test_queue_timeout(self):
+        """Test that a job gives up after waiting queue_timeout seconds."""
+        scheduler = ExtractionScheduler(max_concurrent=1, queue_timeout=0.1)
+        self.submit(scheduler, "blocker", "a", 1, hold=True)
+        with self.assertRaises(SchedulerSaturated):
+            with scheduler.slot("b", 1, 0):
+                pass
+        self.assertEqual(scheduler.stats()["waiting"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from datetime import datetime, timedelta
+from search_index import SearchIndex, make_snippet, parse_query, tokenize
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2024, 1, 1, 12, 0)
+        self.index = SearchIndex()
+        self.index.add_document("a", [
+            "Building permit application for a new garage.",
+            "Permit number 2022-4227 issued for the detached garage.",
+        ], "garage_permit.pdf", self.now + timedelta(hours=24), self.now)
+        self.index.add_document("b", [
+            "Electrical inspection report. The inspection passed.",
+        ], "inspection.pdf", self.now + timedelta(hours=1), self.now)
+        self.index.add_document("c", [
+            "Demolition permit for the old garage shed.",
+        ], "demolition.pdf", self.now + timedelta(hours=24), self.now)
+
+    def ids(self, query, **kwargs):
+        return [result["document_id"] for result in self.index.search(query, **kwargs)["results"]]
+
+    def test_tokenize_indexes_compound_tokens_whole_and_in_parts(self):
+        self.assertEqual(tokenize("No. 2022-4227"), [(0, "no"), (1, "2022-4227"), (1, "2022"), (1, "4227")])
+
+    def test_parse_query(self):
+        self.assertEqual(
+            parse_query('garage "detached garage" filename:permit'),
+            [("text", ["garage"]), ("text", ["detached", "garage"]), ("filename", ["permit"])]
+        )
+        self.assertEqual(parse_query("2022-4227"), [("text", ["2022-4227"])])
+        # Only known fields are prefixes; anything else before a colon is text
+        self.assertEqual(parse_query("APN:052-123"), [("text", ["apn", "052-123"])])
+        self.assertEqual(parse_query("inspection at 10:30"), [("text", ["inspection"]), ("text", ["at"]), ("text", ["10", "30"])])
+        self.assertEqual(parse_query("Filename:permit"), [("filename", ["permit"])])
+
+    def test_colon_terms_match_literally(self):
+        self.index.add_document("d", ["Parcel APN:052-123, inspection at 10:30."], "d.pdf", self.now + timedelta(hours=24), self.now)
+        self.assertEqual(self.ids("APN:052-123"), ["d"])
+        self.assertEqual(self.ids("10:30"), ["d"])
+
+    def test_all_clauses_must_match(self):
+        self.assertEqual(sorted(self.ids("garage permit")), ["a", "c"])
+        self.assertEqual(self.ids("garage inspection"), [])
+
+    def test_phrase_query(self):
+        self.assertEqual(self.ids('"detached garage"'), ["a"])
+        self.assertEqual(self.ids('"garage detached"'), [])
+
+    def test_compound_token_query(self):
+        self.assertEqual(self.ids("2022-4227"), ["a"])
+        self.assertEqual(self.ids("4227"), ["a"])
+
+    def test_field_query(self):
+        self.assertEqual(self.ids("filename:demolition"), ["c"])
+        self.assertEqual(self.index.search("filename:demolition")["results"][0]["page"], None)
+
+    def test_result_reports_matching_page(self):
+        result = self.index.search('"detached garage"')["results"][0]
+        self.assertEqual(result["page"], 1)
+
+    def test_ranking_and_pagination(self):
+        found = self.index.search("garage", page_size=1)
+        self.assertEqual(found["total"], 2)
+        self.assertEqual(len(found["results"]), 1)
+        # Document a mentions garage twice
+        self.assertEqual(found["results"][0]["document_id"], "a")
+        self.assertEqual(self.ids("garage", page=2, page_size=1), ["c"])
+        self.assertEqual(self.ids("garage", page=3, page_size=1), [])
+
+    def test_prune_expired(self):
+        self.assertEqual(self.index.prune_expired(self.now + timedelta(hours=2)), ["b"])
+        self.assertNotIn("b", self.index)
+        self.assertEqual(self.ids("inspection"), [])
+        self.assertEqual(len(self.index), 2)
+
+    def test_readding_replaces_document(self):
+        self.index.add_document("b", ["Plumbing permit."], "plumbing.pdf", self.now + timedelta(hours=24), self.now)
+        self.assertEqual(self.ids("inspection"), [])
+        self.assertEqual(self.ids("plumbing"), ["b"])
+        # The earlier expiry time no longer applies
+        self.assertEqual(self.index.prune_expired(self.now + timedelta(hours=2)), [])
+
+    def test_results_carry_snippets(self):
+        result = self.index.search('"detached garage"')["results"][0]
+        self.assertIn("detached garage", result["snippet"])
+        self.assertIsNone(self.index.search("filename:demolition")["results"][0]["snippet"])
+
+    def test_tenant_only_sees_own_documents(self):
+        self.index.add_document("d", ["Garage conversion permit."], "d.pdf", self.now + timedelta(hours=24), self.now, tenant="203.0.113.7")
+        self.assertEqual(self.ids("garage", tenant="203.0.113.7"), ["d"])
+        self.assertEqual(self.ids("garage", tenant="198.51.100.2"), [])
+
+    def test_index_is_capped_by_evicting_documents_closest_to_expiry(self):
+        index = SearchIndex()
+        index.add_document("a", ["Garage permit."], "a.pdf", self.now + timedelta(hours=2))
+        # Room for one document only
+        index.max_bytes = index.size_bytes
+        self.assertTrue(index.add_document("b", ["Garage permit."], "b.pdf", self.now + timedelta(hours=3)))
+        self.assertNotIn("a", index)
+        self.assertFalse(index.add_document("c", ["Garage permit."], "c.pdf", self.now + timedelta(hours=1)))
+        self.assertEqual(index.search("garage")["total"], 1)
+
+        index.max_bytes = None
+        index.remove_document("b")
+        self.assertEqual(index.size_bytes, 0)
+
+    def test_make_snippet(self):
+        text = "x " * 200 + "detached garage" + " y" * 200
+        snippet = make_snippet(text, '"detached garage"')
+        self.assertIn("detached garage", snippet)
+        self.assertTrue(snippet.startswith("...") and snippet.endswith("..."))
+        self.assertEqual(make_snippet("Short text", "missing"), "Short text")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import time
+import unittest
+import threading
+from singleflight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, flights, key, fn, count=5):
+        """Call flights.do from several threads at once and collect the outcomes."""
+        outcomes = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                outcome = flights.do(key, fn)
+            except Exception as e:
+                outcome = e
+            with lock:
+                outcomes.append(outcome)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def slow_call(self, calls, result=None, error=None):
+        def fn():
+            calls.append(1)
+            time.sleep(0.2)
+            if error:
+                raise error
+            return result
+        return fn
+
+    def test_concurrent_calls_share_one_result(self):
+        """Test that identical in-flight calls run once."""
+        flights = SingleFlight()
+        calls = []
+        outcomes = self.run_concurrently(flights, "doc:question", self.slow_call(calls, result="answer"))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in outcomes), [False, True, True, True, True])
+        self.assertTrue(all(result == "answer" for result, _ in outcomes))
+        self.assertEqual(flights.in_flight(), 0)
+
+    def test_errors_reach_every_waiter(self):
+        """Test that the leader's exception is raised in every caller."""
+        flights = SingleFlight()
+        calls = []
+        error = RuntimeError("quota exceeded")
+        outcomes = self.run_concurrently(flights, "doc:question", self.slow_call(calls, error=error))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [error] * 5)
+
+        # The failed call is not cached; the next call runs again
+        result, shared = flights.do("doc:question", lambda: "retry")
+        self.assertEqual((result, shared), ("retry", False))
+
+    def test_different_keys_run_separately(self):
+        """Test that calls with different keys are not coalesced."""
+        flights = SingleFlight()
+        self.assertEqual(flights.do("a", lambda: 1), (1, False))
+        self.assertEqual(flights.do("b", lambda: 2), (2, False))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import unittest
+import tempfile
+import shutil
+from storage_backend import InMemoryStorageBackend, LocalStorageBackend, ReadThroughCache, StorageBackend, create_storage_backend
+
+class TestStorageBackend(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment."""
+        self.test_dir = tempfile.mkdtemp()
+        self.source = os.path.join(self.test_dir, "doc.bpd")
+        with open(self.source, "wb") as f:
+            f.write(b"x" * 100)
+
+    def tearDown(self):
+        """Clean up test environment."""
+        shutil.rmtree(self.test_dir)
+
+    def test_local_backend(self):
+        """Test storing, reading and deleting objects on local disk."""
+        backend = LocalStorageBackend(os.path.join(self.test_dir, "store"))
+        backend.put("documents/a.bpd", b"abc")
+        self.assertEqual(backend.get("documents/a.bpd"), b"abc")
+        self.assertTrue(os.path.exists(backend.local_path("documents/a.bpd")))
+        backend.delete("documents/a.bpd")
+        self.assertIsNone(backend.get("documents/a.bpd"))
+        with self.assertRaises(ValueError):
+            backend.get("../outside")
+
+    def test_read_through_cache_shared_backend(self):
+        """Test that a document stored by one instance can be read by another."""
+        backend = InMemoryStorageBackend()
+        upload_instance = ReadThroughCache(backend, os.path.join(self.test_dir, "cache1"))
+        ask_instance = ReadThroughCache(backend, os.path.join(self.test_dir, "cache2"))
+
+        upload_instance.store("documents/a.bpd", self.source)
+        path = ask_instance.fetch("documents/a.bpd")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"x" * 100)
+
+        # Later reads are served from the local copy
+        backend.delete("documents/a.bpd")
+        self.assertEqual(ask_instance.fetch("documents/a.bpd"), path)
+        self.assertIsNone(ask_instance.fetch("documents/missing.bpd"))
+
+    def test_cache_eviction(self):
+        """Test that the cache stays under its size limit."""
+        backend = InMemoryStorageBackend()
+        cache = ReadThroughCache(backend, os.path.join(self.test_dir, "cache"), max_bytes=250)
+        for i in range(5):
+            cache.store(f"documents/{i}.bpd", self.source)
+        cached = os.listdir(os.path.join(self.test_dir, "cache"))
+        self.assertLessEqual(len(cached), 2)
+        self.assertIsNotNone(cache.fetch("documents/0.bpd"))
+
+    def test_create_storage_backend(self):
+        """Test backend selection."""
+        self.assertIsInstance(create_storage_backend("memory", self.test_dir), InMemoryStorageBackend)
+        self.assertIsInstance(create_storage_backend("local", self.test_dir), LocalStorageBackend)
+        self.assertFalse(create_storage_backend("local", self.test_dir).shared)
+        with self.assertRaises(ValueError):
+            create_storage_backend("gcs", self.test_dir)
+
+    def test_incomplete_backend_cannot_be_created(self):
+        """Test that a backend missing required methods fails when it is created."""
+        class PartialBackend(StorageBackend):
+            def put(self, key, data):
+                pass
+
+        with self.assertRaises(TypeError):
+            PartialBackend()
+
+    def test_list_keys(self):
+        """Test listing keys by prefix on the local and in-memory backends."""
+        for backend in (LocalStorageBackend(os.path.join(self.test_dir, "store")), InMemoryStorageBackend()):
+            backend.put("documents/a.bpd", b"a")
+            backend.put("uploads/u/manifest.json", b"{}")
+            self.assertEqual(backend.list_keys("documents/"), ["documents/a.bpd"])
+
+if __name__ == '__main__':
+    unittest.main()
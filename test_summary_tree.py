@@ -0,0 +1,60 @@
+import unittest
+from summary_tree import build_summary_tree, is_broad_question, select_context
+
+def fake_summarize(prompt):
+    """Return the start of the last prompt line so tests can tell summaries apart."""
+    return "SUMMARY " + prompt.split("\n")[-1][:40]
+
+class TestSummaryTree(unittest.TestCase):
+    def setUp(self):
+        """Set up test environment."""
+        self.pages = [f"Sheet {i} general notes for the building permit.\n" * 5 for i in range(100)]
+        self.pages[42] += "Fire sprinkler riser located in garage per NFPA 13D.\n"
+
+    def read_pages(self, start, end):
+        return "".join(self.pages[start:end])
+
+    def test_tree_levels(self):
+        """Test that leaves cover the pages and the tree reduces to a single root."""
+        tree = build_summary_tree(self.pages, fake_summarize, pages_per_chunk=10, fan_out=4)
+        levels = tree["levels"]
+        self.assertEqual(len(levels[0]), 10)
+        self.assertEqual(len(levels[1]), 3)
+        self.assertEqual(len(levels[-1]), 1)
+        self.assertEqual(levels[-1][0]["start_page"], 0)
+        self.assertEqual(levels[-1][0]["end_page"], 100)
+
+    def test_question_classification(self):
+        """Test broad and detail question detection."""
+        self.assertTrue(is_broad_question("Give me an overview of the project scope"))
+        self.assertFalse(is_broad_question("Where is the fire sprinkler riser?"))
+        self.assertFalse(is_broad_question("Where is the main electrical panel?"))
+        self.assertFalse(is_broad_question("What is the key box code?"))
+        self.assertFalse(is_broad_question("Describe the roof framing at gridline C"))
+
+    def test_detail_question_uses_matching_pages(self):
+        """Test that detail questions get the original pages of the matching leaf."""
+        tree = build_summary_tree(self.pages, fake_summarize, pages_per_chunk=10, fan_out=4)
+        context = select_context(tree, "Where is the sprinkler riser?", self.read_pages, 5000)
+        self.assertIn("NFPA 13D", context)
+        self.assertIn("[Pages 41-50]", context)
+        self.assertLessEqual(len(context), 5000)
+
+    def test_broad_question_uses_summaries(self):
+        """Test that broad questions are answered from summaries that fit the budget."""
+        tree = build_summary_tree(self.pages, fake_summarize, pages_per_chunk=10, fan_out=4)
+        context = select_context(tree, "Summarize this permit", self.read_pages, 2000)
+        self.assertNotIn("NFPA 13D", context)
+        self.assertIn("[Summary of pages", context)
+        self.assertLessEqual(len(context), 2000)
+
+    def test_broad_question_with_matching_pages(self):
+        """Test that broad questions still get the matching pages when the budget allows."""
+        tree = build_summary_tree(self.pages, fake_summarize, pages_per_chunk=10, fan_out=4)
+        context = select_context(tree, "Summarize the sprinkler riser requirements", self.read_pages, 5000)
+        self.assertIn("NFPA 13D", context)
+        self.assertIn("[Summary of pages", context)
+        self.assertLessEqual(len(context), 5000)
+
+if __name__ == '__main__':
+    unittest.main()